@@ -0,0 +1,154 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Tuple
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collect concurrent predict calls into one batched model request.
+
+    Callers `submit` a single instance and get back their own slice of the
+    batch predictions. A batch is dispatched once `max_batch_size` instances
+    are queued or `max_wait_ms` has passed since the first one arrived.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        predict_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+    ):
+        self.name = name
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+
+        self.queue: asyncio.Queue[Tuple[Any, asyncio.Future]] | None = None
+        self.worker: asyncio.Task | None = None
+        self.in_flight: set[asyncio.Task] = set()
+
+        self.total_requests = 0
+        self.total_batches = 0
+        self.max_seen_batch_size = 0
+        self.max_seen_queue_depth = 0
+        self.last_batch_size = 0
+
+    async def start(self) -> None:
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight, return_exceptions=True)
+
+        while self.queue is not None and not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} batcher stopped"))
+
+    async def submit(self, instance: Any) -> Any:
+        """
+        Queue one instance and wait for its prediction.
+
+        Args:
+            instance (Any): A single model input.
+
+        Returns:
+            Any: The prediction for this instance.
+        """
+        if self.worker is None:
+            await self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((instance, future))
+        self.max_seen_queue_depth = max(self.max_seen_queue_depth, self.queue.qsize())
+
+        return await future
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Dispatch without waiting so the next batch can fill meanwhile
+            task = asyncio.create_task(self.dispatch(batch))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def dispatch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        # Drop callers that went away while queued
+        batch = [(instance, future) for instance, future in batch if not future.done()]
+        if not batch:
+            return
+
+        # Only instances of one shape stack into a model call, so each shape
+        # goes on its own and a mismatched instance fails alone
+        groups = {}
+        for instance, future in batch:
+            key = (np.shape(instance), getattr(instance, "dtype", None))
+            groups.setdefault(key, []).append((instance, future))
+
+        await asyncio.gather(*(self.predict_group(group) for group in groups.values()))
+
+    async def predict_group(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.total_requests += len(batch)
+        self.total_batches += 1
+        self.last_batch_size = len(batch)
+        self.max_seen_batch_size = max(self.max_seen_batch_size, len(batch))
+
+        try:
+            predictions = await self.predict_batch([instance for instance, _ in batch])
+
+            if len(predictions) != len(batch):
+                raise ValueError(
+                    f"{self.name} returned {len(predictions)} predictions for {len(batch)} instances"
+                )
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for (_, future), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(prediction)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue_depth": self.max_seen_queue_depth,
+            "in_flight_batches": len(self.in_flight),
+            "total_requests": self.total_requests,
+            "total_batches": self.total_batches,
+            "avg_batch_size": (
+                self.total_requests / self.total_batches if self.total_batches else 0.0
+            ),
+            "max_batch_size": self.max_seen_batch_size,
+            "last_batch_size": self.last_batch_size,
+            "config": {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            },
+        }
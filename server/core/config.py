@@ -1,8 +1,100 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
 class Config(BaseSettings):
     tensorflow_api_url: str = ""
+    # Tensor transport to TF Serving: nested-list JSON, base64 raw bytes over
+    # REST (needs a string input signature) or gRPC `tensor_content`
+    tensorflow_transport: Literal["json", "b64", "grpc"] = "json"
+    tensorflow_grpc_url: str = ""
+    tensorflow_signature_name: str = "serving_default"
+    # Connection pool shared by every TF Serving call
+    tensorflow_max_connections: int = 100
+    tensorflow_max_keepalive_connections: int = 20
+    tensorflow_keepalive_expiry: float = 30.0
+    tensorflow_connect_timeout: float = 5.0
+    # Per-model request timeouts (seconds)
+    detector_timeout: float = 10.0
+    embedder_timeout: float = 30.0
+    # Inference backend per model: TF Serving, or in-process ONNX Runtime /
+    # TFLite on CPU loading the exported model from disk
+    detector_backend: Literal["tfserving", "onnx", "tflite"] = "tfserving"
+    detector_model_path: str = "./assets/models/custom-detector.onnx"
+    embedder_backend: Literal["tfserving", "onnx", "tflite"] = "tfserving"
+    embedder_model_path: str = "./assets/models/custom-embedder.onnx"
+    # Threads for the local backends (0 lets the runtime decide)
+    inference_intra_op_threads: int = 0
+    inference_inter_op_threads: int = 0
+    # Signature inputs used by the binary transports
+    detector_input_name: str = "inputs"
+    detector_input_dtype: str = "float32"
+    embedder_input_name: str = "inputs"
+    embedder_input_dtype: str = "float32"
+    # Largest image upload body (JSON, raw or multipart), enforced while it
+    # streams in
+    max_upload_bytes: int = 32 * 1024 * 1024
+    # Decode detect uploads at a reduced JPEG scale down to this longer
+    # side (0 decodes at full resolution)
+    detector_decode_min_size: int = 640
+    # Embedder crops per predict call and concurrent calls per request
+    embedder_batch_size: int = 32
+    embedder_concurrency: int = 4
+    # Full-resolution decodes kept in memory between /image/detect and
+    # /image/embedding
+    image_cache_max_bytes: int = 256 * 1024 * 1024
+    image_cache_ttl: float = 300.0
+    # Detect and OMR results keyed by upload hash, so retries skip the work.
+    # Both backends honor the TTL and byte bound; the disk one prunes its
+    # oldest files once it grows past the bound
+    result_cache_backend: Literal["none", "memory", "disk"] = "memory"
+    result_cache_max_bytes: int = 64 * 1024 * 1024
+    result_cache_ttl: float = 3600.0
+    result_cache_path: str = "./assets/results"
+    # Uploaded images, stored once per distinct content on local disk or in
+    # an S3-compatible bucket, plus the SQLite index from image id to blob
+    image_store_backend: Literal["local", "s3"] = "local"
+    image_store_path: str = "./assets/images"
+    image_store_index_path: str = "./assets/images/index.sqlite3"
+    image_store_s3_bucket: str = ""
+    image_store_s3_prefix: str = "images/"
+    image_store_s3_endpoint_url: str = ""
+    image_store_s3_region: str = ""
+    # Detection postprocess defaults, overridable per request
+    detector_conf_threshold: float = 0.25
+    detector_iou_threshold: float = 0.5
+    detector_pre_nms_top_k: int = 3000
+    detector_max_detections: int = 300
+    # Cross-request micro-batching in front of the detector
+    detector_max_batch_size: int = 8
+    detector_batch_wait_ms: float = 5.0
+    # /image/detect/batch: most images per request and per predict call, and
+    # largest JSON body, enforced while it streams in
+    detector_batch_max_images: int = 64
+    detector_batch_predict_size: int = 32
+    detector_batch_max_bytes: int = 256 * 1024 * 1024
+    # Worker processes for the CPU-heavy route stages (0 runs them in a
+    # thread instead) and the shared-memory slot per worker and direction;
+    # larger arrays fall back to the pipe. Slots shrink to fit half the free
+    # /dev/shm, so raise the container's shm_size for more or larger slots
+    worker_processes: int = 0
+    worker_slot_bytes: int = 32 * 1024 * 1024
+    # OMR sheets run in their own worker processes; requests beyond
+    # `omr_max_queue` waiting for one get a 503 with Retry-After. Pages of
+    # /image/omr/batch run in parallel only with OMR_WORKERS above 1, up to
+    # one per CPU core
+    omr_workers: int = 1
+    omr_max_queue: int = 8
+    # Extra OMR sheet layout templates (JSON) on top of the built-in ones,
+    # and how many compiled question ranges to keep
+    omr_layouts_path: str = "./assets/layouts"
+    omr_layout_cache_size: int = 128
+    # /image/omr/batch: PDF render resolution, most pages per request and
+    # largest multipart body, enforced while it streams in
+    omr_pdf_dpi: int = 300
+    omr_batch_max_pages: int = 200
+    omr_batch_max_bytes: int = 256 * 1024 * 1024
 
 
 config = Config()
@@ -0,0 +1,181 @@
+from abc import ABC, abstractmethod
+import asyncio
+import threading
+
+import numpy as np
+
+from server.core import serving
+from server.core.config import config
+
+# onnxruntime input types, e.g. "tensor(float)"
+ONNX_DTYPES = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(uint8)": np.uint8,
+    "tensor(int8)": np.int8,
+    "tensor(int32)": np.int32,
+    "tensor(int64)": np.int64,
+}
+
+
+class InferenceBackend(ABC):
+    """
+    Runs one model on a batch. `predict` takes and returns batched arrays
+    with the same layout as TF Serving's `predictions`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def load(self) -> None:
+        pass
+
+    @abstractmethod
+    async def predict(self, instances: np.ndarray) -> np.ndarray: ...
+
+
+class TFServingBackend(InferenceBackend):
+    def __init__(self, name: str, timeout: float, input_name: str, input_dtype: str):
+        super().__init__(name)
+        self.timeout = timeout
+        self.input_name = input_name
+        self.input_dtype = input_dtype
+
+    async def predict(self, instances: np.ndarray) -> np.ndarray:
+        return await serving.predict(
+            self.name, instances, self.timeout, self.input_name, self.input_dtype
+        )
+
+
+class LocalBackend(InferenceBackend):
+    """
+    In-process CPU backend loading an exported model from disk. Inference
+    runs in a worker thread; the runtimes release the GIL while computing.
+    """
+
+    def __init__(self, name: str, model_path: str):
+        super().__init__(name)
+        self.model_path = model_path
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    async def load(self) -> None:
+        await asyncio.to_thread(self.ensure_loaded)
+
+    def ensure_loaded(self) -> None:
+        with self.lock:
+            if not self.loaded:
+                self.open()
+                self.loaded = True
+                print(f"Model {self.name} loaded from {self.model_path}")
+
+    @abstractmethod
+    def open(self) -> None: ...
+
+    @abstractmethod
+    def run(self, instances: np.ndarray) -> np.ndarray: ...
+
+    def infer(self, instances: np.ndarray) -> np.ndarray:
+        self.ensure_loaded()
+        return self.run(instances)
+
+    async def predict(self, instances: np.ndarray) -> np.ndarray:
+        return await asyncio.to_thread(self.infer, instances)
+
+
+class OnnxBackend(LocalBackend):
+    def open(self) -> None:
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("onnx backend requires the `onnxruntime` package")
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = config.inference_intra_op_threads
+        options.inter_op_num_threads = config.inference_inter_op_threads
+
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = ONNX_DTYPES.get(model_input.type, np.float32)
+
+    def run(self, instances: np.ndarray) -> np.ndarray:
+        outputs = self.session.run(
+            None, {self.input_name: instances.astype(self.input_dtype, copy=False)}
+        )
+
+        return outputs[0]
+
+
+class TFLiteBackend(LocalBackend):
+    def open(self) -> None:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                raise RuntimeError(
+                    "tflite backend requires the `ai-edge-litert` package"
+                )
+
+        threads = config.inference_intra_op_threads
+        self.interpreter = Interpreter(
+            model_path=self.model_path, num_threads=threads if threads > 0 else None
+        )
+        self.interpreter.allocate_tensors()
+        self.batch_size = None
+
+    def run(self, instances: np.ndarray) -> np.ndarray:
+        # The interpreter holds mutable state, so one batch at a time
+        with self.lock:
+            model_input = self.interpreter.get_input_details()[0]
+
+            if self.batch_size != len(instances):
+                self.interpreter.resize_tensor_input(
+                    model_input["index"], [len(instances), *model_input["shape"][1:]]
+                )
+                self.interpreter.allocate_tensors()
+                self.batch_size = len(instances)
+
+            self.interpreter.set_tensor(
+                model_input["index"],
+                instances.astype(model_input["dtype"], copy=False),
+            )
+            self.interpreter.invoke()
+
+            model_output = self.interpreter.get_output_details()[0]
+            return self.interpreter.get_tensor(model_output["index"]).copy()
+
+
+def create_backend(
+    name: str,
+    backend: str,
+    model_path: str,
+    timeout: float,
+    input_name: str,
+    input_dtype: str,
+) -> InferenceBackend:
+    """
+    Build the inference backend configured for a model.
+
+    Args:
+        name (str): Model name, also the TF Serving model name.
+        backend (str): "tfserving", "onnx" or "tflite".
+        model_path (str): Exported model file for the local backends.
+        timeout (float): TF Serving request timeout in seconds.
+        input_name (str): TF Serving signature input name.
+        input_dtype (str): TF Serving signature input dtype.
+
+    Returns:
+        InferenceBackend: The backend instance.
+    """
+    if backend == "onnx":
+        return OnnxBackend(name, model_path)
+    if backend == "tflite":
+        return TFLiteBackend(name, model_path)
+
+    return TFServingBackend(name, timeout, input_name, input_dtype)
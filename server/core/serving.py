@@ -0,0 +1,123 @@
+import httpx
+import numpy as np
+
+from server.core import transport
+from server.core.config import config
+
+client: httpx.AsyncClient | None = None
+channel = None
+
+PREDICT_METHOD = "/tensorflow.serving.PredictionService/Predict"
+
+
+async def open_client() -> httpx.AsyncClient:
+    """
+    Open the app-lifetime TF Serving client with keep-alive pooling.
+
+    Returns:
+        httpx.AsyncClient: The shared client.
+    """
+    global client, channel
+
+    if client is None:
+        client = httpx.AsyncClient(
+            base_url=config.tensorflow_api_url,
+            limits=httpx.Limits(
+                max_connections=config.tensorflow_max_connections,
+                max_keepalive_connections=config.tensorflow_max_keepalive_connections,
+                keepalive_expiry=config.tensorflow_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                config.detector_timeout, connect=config.tensorflow_connect_timeout
+            ),
+        )
+
+    if channel is None and config.tensorflow_transport == "grpc":
+        try:
+            import grpc
+        except ImportError:
+            raise RuntimeError("grpc transport requires the `grpcio` package")
+
+        channel = grpc.aio.insecure_channel(
+            config.tensorflow_grpc_url,
+            options=[
+                ("grpc.max_send_message_length", -1),
+                ("grpc.max_receive_message_length", -1),
+            ],
+        )
+
+    return client
+
+
+async def close_client() -> None:
+    global client, channel
+
+    if client is not None:
+        await client.aclose()
+        client = None
+
+    if channel is not None:
+        await channel.close()
+        channel = None
+
+
+def get_client() -> httpx.AsyncClient:
+    if client is None:
+        raise RuntimeError("TF Serving client is not open")
+
+    return client
+
+
+async def predict(
+    model: str,
+    instances: np.ndarray,
+    timeout: float,
+    input_name: str = "inputs",
+    input_dtype: str = "float32",
+) -> np.ndarray:
+    """
+    Send a batch to TF Serving over the configured tensor transport.
+
+    Args:
+        model (str): Served model name, e.g. "custom-detector".
+        instances (np.ndarray): Batched model input.
+        timeout (float): Read timeout for this model in seconds.
+        input_name (str): Signature input name, used by the binary transports.
+        input_dtype (str): Signature input dtype, used by the binary transports.
+
+    Returns:
+        np.ndarray: Batched predictions.
+    """
+    if config.tensorflow_transport == "grpc":
+        if channel is None:
+            raise RuntimeError("TF Serving gRPC channel is not open")
+
+        request = transport.encode_predict_request(
+            model,
+            config.tensorflow_signature_name,
+            {input_name: instances.astype(input_dtype, copy=False)},
+        )
+        response = await channel.unary_unary(PREDICT_METHOD)(request, timeout=timeout)
+        outputs = transport.decode_predict_response(response)
+
+        if len(outputs) != 1:
+            raise ValueError(
+                f"Expected a single output from {model}, got {list(outputs)}"
+            )
+
+        return next(iter(outputs.values()))
+
+    if config.tensorflow_transport == "b64":
+        content = transport.encode_b64(instances.astype(input_dtype, copy=False))
+    else:
+        content = transport.encode_json(instances)
+
+    response = await get_client().post(
+        f"/v1/models/{model}:predict",
+        content=content,
+        headers={"Content-Type": "application/json"},
+        timeout=httpx.Timeout(timeout, connect=config.tensorflow_connect_timeout),
+    )
+    response.raise_for_status()
+
+    return transport.decode_rest(response.content)
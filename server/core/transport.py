@@ -0,0 +1,209 @@
+import base64
+import json
+from typing import Dict, Tuple
+
+import numpy as np
+
+# tensorflow/core/framework/types.proto
+DTYPES = {
+    1: np.float32,
+    2: np.float64,
+    3: np.int32,
+    4: np.uint8,
+    5: np.int16,
+    6: np.int8,
+    9: np.int64,
+    10: np.bool_,
+    19: np.float16,
+}
+DTYPE_IDS = {np.dtype(dtype): id for id, dtype in DTYPES.items()}
+
+# TensorProto fields holding repeated values, by numpy dtype
+VALUE_FIELDS = {
+    5: (np.float32, "f"),
+    6: (np.float64, "d"),
+    7: (np.int32, None),
+    10: (np.int64, None),
+}
+
+
+def encode_json(instances: np.ndarray) -> bytes:
+    """
+    Encode a batch as a TF Serving REST `instances` body of nested lists.
+    """
+    return json.dumps({"instances": instances.tolist()}).encode()
+
+
+def encode_b64(instances: np.ndarray) -> bytes:
+    """
+    Encode a batch as one base64 blob of raw tensor bytes per instance.
+
+    The served signature must take a string input and restore the tensor
+    with `tf.io.decode_raw`, since REST only carries binary as DT_STRING.
+    """
+    instances = np.ascontiguousarray(instances)
+
+    return json.dumps(
+        {
+            "instances": [
+                {"b64": base64.b64encode(instance.tobytes()).decode("ascii")}
+                for instance in instances
+            ]
+        }
+    ).encode()
+
+
+def decode_rest(content: bytes) -> np.ndarray:
+    """
+    Decode a TF Serving REST response straight into a float32 array.
+    """
+    return np.asarray(json.loads(content)["predictions"], dtype=np.float32)
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _read_varint(data: memoryview, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_fields(data: memoryview):
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos : pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos : pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = data[pos : pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+
+        yield number, wire_type, value
+
+
+def encode_tensor(array: np.ndarray) -> bytes:
+    """
+    Encode an array as a TensorProto using `tensor_content`.
+    """
+    array = np.ascontiguousarray(array)
+
+    dtype_id = DTYPE_IDS.get(array.dtype)
+    if dtype_id is None:
+        raise ValueError(f"Unsupported tensor dtype {array.dtype}")
+
+    shape = b"".join(_field(2, b"\x08" + _varint(size)) for size in array.shape)
+
+    content = array.astype(array.dtype.newbyteorder("<"), copy=False).tobytes()
+
+    return b"".join([b"\x08", _varint(dtype_id), _field(2, shape), _field(4, content)])
+
+
+def decode_tensor(data: memoryview) -> np.ndarray:
+    """
+    Decode a TensorProto into an array, from `tensor_content` or typed values.
+    """
+    dtype = np.float32
+    shape = []
+    content = None
+    values = []
+
+    for number, wire_type, value in _read_fields(data):
+        if number == 1:
+            dtype = DTYPES[value]
+        elif number == 2:
+            for dim_number, _, dim in _read_fields(value):
+                if dim_number == 2:
+                    size = next(
+                        (v for n, _, v in _read_fields(dim) if n == 1),
+                        0,
+                    )
+                    shape.append(size)
+        elif number == 4:
+            content = value
+        elif number in VALUE_FIELDS:
+            field_dtype, fmt = VALUE_FIELDS[number]
+            if fmt is not None:
+                # Packed or single fixed-width values share the same layout
+                values.append(np.frombuffer(value, np.dtype(fmt).newbyteorder("<")))
+            elif wire_type == 2:
+                packed, pos = [], 0
+                while pos < len(value):
+                    item, pos = _read_varint(value, pos)
+                    packed.append(item)
+                values.append(np.array(packed, dtype=field_dtype))
+            else:
+                values.append(np.array([value], dtype=field_dtype))
+
+    if content is not None:
+        array = np.frombuffer(content, dtype=np.dtype(dtype).newbyteorder("<"))
+    elif values:
+        array = np.concatenate(values).astype(dtype, copy=False)
+    else:
+        array = np.zeros(0, dtype=dtype)
+
+    return array.reshape(shape) if shape else array
+
+
+def encode_predict_request(
+    model: str, signature_name: str, inputs: Dict[str, np.ndarray]
+) -> bytes:
+    """
+    Encode a tensorflow.serving.PredictRequest.
+    """
+    model_spec = _field(1, model.encode()) + _field(3, signature_name.encode())
+
+    request = _field(1, model_spec)
+    for name, array in inputs.items():
+        request += _field(2, _field(1, name.encode()) + _field(2, encode_tensor(array)))
+
+    return request
+
+
+def decode_predict_response(data: bytes) -> Dict[str, np.ndarray]:
+    """
+    Decode a tensorflow.serving.PredictResponse into named output arrays.
+    """
+    outputs = {}
+
+    for number, _, entry in _read_fields(memoryview(data)):
+        if number != 1:
+            continue
+
+        name, tensor = "", None
+        for entry_number, _, value in _read_fields(entry):
+            if entry_number == 1:
+                name = bytes(value).decode()
+            elif entry_number == 2:
+                tensor = decode_tensor(value)
+
+        if tensor is not None:
+            outputs[name] = tensor
+
+    return outputs
@@ -0,0 +1,359 @@
+import asyncio
+import math
+import mmap
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+import os
+import pickle
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+import numpy as np
+
+from server.core.config import config
+
+
+SHM_PATH = "/dev/shm"
+
+# Shared memory promised to the slots of every started pool. Segments are
+# sparse until written, so free space alone doesn't account for them
+_shm_reserved = 0
+
+
+def shm_free() -> Optional[int]:
+    """
+    Free bytes on the shared-memory tmpfs, None where there is none to check.
+    """
+    try:
+        stats = os.statvfs(SHM_PATH)
+    except OSError:
+        return None
+
+    return stats.f_bavail * stats.f_frsize
+
+
+def _worker_main(conn, input_name: str, output_name: str) -> None:
+    input_memory = SharedMemory(name=input_name)
+    output_memory = SharedMemory(name=output_name)
+    # Spawned children share the parent's resource tracker, which unlinks the
+    # segments once the parent is gone
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        func, shape, dtype, inline, args = message
+
+        try:
+            if inline is not None:
+                array = inline
+            else:
+                array = np.ndarray(shape, dtype=dtype, buffer=input_memory.buf)
+
+            result = func(array, *args)
+
+            if isinstance(result, np.ndarray) and result.nbytes <= output_memory.size:
+                output = np.ndarray(
+                    result.shape, result.dtype, buffer=output_memory.buf
+                )
+                output[...] = result
+                conn.send(("array", result.shape, result.dtype.str))
+            else:
+                conn.send(("object", result))
+        except HTTPException as error:
+            conn.send(("http_error", error.status_code, error.detail))
+        except Exception as error:
+            try:
+                pickle.dumps(error)
+                conn.send(("error", error))
+            except Exception:
+                conn.send(("error", RuntimeError(repr(error))))
+
+    input_memory.close()
+    output_memory.close()
+
+
+class Worker:
+    def __init__(self, index: int, slot_bytes: int, context):
+        self.index = index
+        self.context = context
+        self.input_memory = SharedMemory(create=True, size=slot_bytes)
+        self.output_memory = SharedMemory(create=True, size=slot_bytes)
+
+        self.process = None
+        self.conn = None
+        self.tasks = 0
+        self.inline_tasks = 0
+        self.restarts = 0
+        self.busy_time = 0.0
+        self.started = time.monotonic()
+
+    def spawn(self) -> None:
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, self.input_memory.name, self.output_memory.name),
+            daemon=True,
+        )
+        self.process.start()
+        # Only the child keeps its end, so a crash shows up as EOF here
+        child_conn.close()
+
+    def restart(self) -> None:
+        print(f"Worker {self.index} restarting")
+        self.kill()
+        self.restarts += 1
+        self.spawn()
+
+    def kill(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+    def close(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.conn.send(None)
+                self.process.join(timeout=5)
+            except (BrokenPipeError, OSError):
+                pass
+        self.kill()
+
+        self.input_memory.close()
+        self.input_memory.unlink()
+        self.output_memory.close()
+        self.output_memory.unlink()
+
+    def call(self, func: Callable, array: np.ndarray, args: tuple) -> Any:
+        if not self.process.is_alive():
+            self.restart()
+
+        # Arrays travel through shared memory; oversized ones fall back to the pipe
+        inline = None
+        if array.nbytes <= self.input_memory.size:
+            view = np.ndarray(array.shape, array.dtype, buffer=self.input_memory.buf)
+            view[...] = array
+        else:
+            inline = array
+            self.inline_tasks += 1
+
+        try:
+            self.conn.send((func, array.shape, array.dtype.str, inline, args))
+            reply = self.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            self.restart()
+            raise RuntimeError(f"Worker {self.index} crashed")
+
+        kind, *payload = reply
+        if kind == "array":
+            shape, dtype = payload
+            return np.ndarray(shape, dtype, buffer=self.output_memory.buf).copy()
+        if kind == "object":
+            return payload[0]
+        if kind == "http_error":
+            raise HTTPException(status_code=payload[0], detail=payload[1])
+        raise payload[0]
+
+    def stats(self) -> dict:
+        uptime = time.monotonic() - self.started
+        return {
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.process is not None and self.process.is_alive(),
+            "tasks": self.tasks,
+            "inline_tasks": self.inline_tasks,
+            "restarts": self.restarts,
+            "utilization": self.busy_time / uptime if uptime > 0 else 0.0,
+        }
+
+
+class WorkerPool:
+    """
+    Pool of worker processes for CPU-heavy stages.
+
+    `run(func, array, *args)` calls a module-level `func(array, *args)` in a
+    worker. Each worker owns a pair of shared-memory slots, so input and
+    output arrays are copied in and out without pickling. With no processes
+    configured, `run` falls back to a thread in this process.
+
+    With `max_queue` set, callers beyond that many waiting for a worker are
+    turned away at once with a 503 and a Retry-After estimate.
+    """
+
+    def __init__(
+        self, name: str, processes: int, slot_bytes: int, max_queue: int | None = None
+    ):
+        self.name = name
+        self.processes = max(0, processes)
+        self.slot_bytes = slot_bytes
+        self.reserved = 0
+        self.max_queue = max_queue
+        self.workers: list[Worker] = []
+        self.idle: asyncio.Queue[Worker] | None = None
+
+        self.waiting = 0
+        self.rejected = 0
+        self.completed = 0
+        self.queue_time = 0.0
+        self.execution_time = 0.0
+
+    async def start(self) -> None:
+        if self.processes == 0 or self.workers:
+            return
+
+        context = multiprocessing.get_context("spawn")
+        self.idle = asyncio.Queue()
+        slot_bytes = self.fit_slot_bytes()
+
+        for index in range(self.processes):
+            worker = Worker(index, slot_bytes, context)
+            await asyncio.to_thread(worker.spawn)
+            self.workers.append(worker)
+            self.idle.put_nowait(worker)
+
+    async def stop(self) -> None:
+        global _shm_reserved
+
+        for worker in self.workers:
+            await asyncio.to_thread(worker.close)
+        self.workers = []
+        self.idle = None
+
+        _shm_reserved -= self.reserved
+        self.reserved = 0
+
+    def fit_slot_bytes(self) -> int:
+        """
+        Shrink the slots to fit half the free shared memory, less what other
+        pools already hold. Filling a slot past the tmpfs size would SIGBUS
+        the API process, while arrays over a small slot just take the pipe.
+        """
+        global _shm_reserved
+
+        slot_bytes = self.slot_bytes
+        free = shm_free()
+        if free is not None:
+            available = max(free // 2 - _shm_reserved, 0)
+            fitted = max(available // (2 * self.processes), mmap.PAGESIZE)
+            if fitted < slot_bytes:
+                print(
+                    f"Worker pool {self.name}: {SHM_PATH} has room for "
+                    f"{fitted} byte slots, not {slot_bytes}; larger arrays "
+                    "take the pipe"
+                )
+                slot_bytes = fitted
+
+        self.reserved = 2 * self.processes * slot_bytes
+        _shm_reserved += self.reserved
+
+        return slot_bytes
+
+    def retry_after(self) -> int:
+        # Time for the callers ahead to drain, at the average execution time
+        average = self.execution_time / self.completed if self.completed else 1.0
+        return max(1, math.ceil((self.waiting + 1) * average / len(self.workers)))
+
+    def admit(self) -> None:
+        """
+        Turn the caller away with a 503 if the admission queue is full.
+        """
+        if (
+            self.workers
+            and self.max_queue is not None
+            and self.idle.empty()
+            and self.waiting >= self.max_queue
+        ):
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"Too many {self.name} requests queued, retry later",
+                headers={"Retry-After": str(self.retry_after())},
+            )
+
+    async def run(self, func: Callable, array: np.ndarray, *args) -> Any:
+        result, _ = await self.run_timed(func, array, *args)
+        return result
+
+    async def run_timed(
+        self, func: Callable, array: np.ndarray, *args
+    ) -> Tuple[Any, Dict[str, float]]:
+        """
+        Run `func(array, *args)` on a worker.
+
+        Returns:
+            Tuple[Any, Dict[str, float]]: The result, and the seconds spent
+            waiting for a worker (`queue`) and running on it (`execution`).
+        """
+        queued = time.monotonic()
+
+        if not self.workers:
+            result = await asyncio.to_thread(func, array, *args)
+            execution = time.monotonic() - queued
+            self.completed += 1
+            self.execution_time += execution
+            return result, {"queue": 0.0, "execution": execution}
+
+        self.admit()
+
+        self.waiting += 1
+        try:
+            worker = await self.idle.get()
+        finally:
+            self.waiting -= 1
+
+        started = time.monotonic()
+        self.queue_time += started - queued
+
+        def release(task: asyncio.Future) -> None:
+            elapsed = time.monotonic() - started
+            worker.tasks += 1
+            worker.busy_time += elapsed
+            self.completed += 1
+            self.execution_time += elapsed
+            self.idle.put_nowait(worker)
+            # Mark the outcome retrieved in case the caller went away
+            if not task.cancelled():
+                task.exception()
+
+        # The worker only goes back once its call is over, even if the
+        # caller is cancelled meanwhile
+        task = asyncio.ensure_future(
+            asyncio.to_thread(worker.call, func, np.ascontiguousarray(array), args)
+        )
+        task.add_done_callback(release)
+        result = await asyncio.shield(task)
+
+        return result, {
+            "queue": started - queued,
+            "execution": time.monotonic() - started,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "processes": len(self.workers),
+            "shared_bytes": self.reserved,
+            "idle": self.idle.qsize() if self.idle is not None else 0,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "avg_queue_ms": (
+                self.queue_time / self.completed * 1000 if self.completed else 0.0
+            ),
+            "avg_execution_ms": (
+                self.execution_time / self.completed * 1000 if self.completed else 0.0
+            ),
+            "workers": [worker.stats() for worker in self.workers],
+        }
+
+
+pool = WorkerPool("worker", config.worker_processes, config.worker_slot_bytes)
+omr_pool = WorkerPool(
+    "omr", config.omr_workers, config.worker_slot_bytes, config.omr_max_queue
+)
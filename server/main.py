@@ -1,14 +1,37 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 # from server.dependencies import get_query_token
 
+from server.core import serving
+from server.core.workers import omr_pool, pool
 from server.routes import health, image
+from server.utils.imageStore import image_store
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await serving.open_client()
+    await pool.start()
+    await omr_pool.start()
+    await image.detect.detector.load()
+    await image.embedding.embedder.load()
+    await image.detect.batcher.start()
+    yield
+    await image.detect.batcher.stop()
+    await omr_pool.stop()
+    await pool.stop()
+    await serving.close_client()
+    image_store.close()
+
 
 # dependencies=[Depends(get_query_token)])
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(health.router)
 app.include_router(image.detect.router)
+app.include_router(image.detect_embed.router)
 app.include_router(image.embedding.router)
 app.include_router(image.omr.router)
 # app.include_router(text.embedding.router)
@@ -1,5 +1,11 @@
 from fastapi import APIRouter
 
+from server.core.workers import omr_pool, pool
+from server.routes.image import detect
+from server.utils.imageCache import image_cache
+from server.utils.imageStore import image_store
+from server.utils.resultCache import result_cache
+
 router = APIRouter(
     prefix="/health",
     tags=["health"],
@@ -10,4 +16,10 @@ router = APIRouter(
 @router.get("/")
 async def get_health():
     # Display all app configs
-    return {"status": "OK"}
+    return {
+        "status": "OK",
+        "batching": {"detector": detect.batcher.stats()},
+        "workers": {"default": pool.stats(), "omr": omr_pool.stats()},
+        "caches": {"image": image_cache.stats(), "result": result_cache.stats()},
+        "store": image_store.stats(),
+    }
@@ -1,6 +1,7 @@
 from . import detect
+from . import detect_embed
 from . import embedding
 from . import omr
 
 
-__all__ = [detect, embedding, omr]
+__all__ = [detect, detect_embed, embedding, omr]
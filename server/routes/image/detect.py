@@ -1,95 +1,140 @@
-import json
-from typing import List, Tuple
-from fastapi import HTTPException
-from pydantic import BaseModel
-import httpx
+import asyncio
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, Field, ValidationError
 from nanoid import generate
 import numpy as np
 
 from .router import router
 
+from server.core.batcher import MicroBatcher
 from server.core.config import config
-from server.utils.base64ToArray import base64_to_array
-from server.utils.convertBoxFormat import convert_box_format
-from server.utils.imageResize import image_resize
-from server.utils.imageScale import image_scale
-from server.utils.imageSave import image_save
+from server.core.inference import create_backend
+from server.core.workers import pool
+from server.utils.base64ToArray import base64_to_bytes, bytes_to_array
+from server.utils.convertBoxFormat import convert_box_formats
+from server.utils.imageIngest import image_cache_full, image_ingest
+from server.utils.imageResize import image_letterbox, image_resize_into
+from server.utils.imageRgb import image_rgb
+from server.utils.imageSave import image_discard, image_save
+from server.utils.imageUpload import (
+    image_upload_openapi,
+    read_body,
+    read_image_upload,
+    validation_error,
+)
+from server.utils.imageScale import image_scale_boxes
 from server.utils.labelBox import label_box
 from server.utils.nonMaxSuppression import nms
+from server.utils.resultCache import result_cache, result_key
 
 DET_DIM = (640, 640)
 
 
-def preprocess(image: np.ndarray) -> list:
-    resized_image, dim = image_resize(image, DET_DIM)
-    return [resized_image.tolist(), dim]
+async def preprocess(
+    image: np.ndarray, dim: Optional[Tuple[int, int]] = None
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    # Gray and RGBA uploads would not stack with RGB ones in a batch
+    resized_image = await pool.run(image_letterbox, image_rgb(image), DET_DIM)
+    # Boxes map back to the original size even if the image was decoded smaller
+    return resized_image, dim or image.shape[:2]
+
+
+class DetectOptions(BaseModel):
+    conf_threshold: float = Field(config.detector_conf_threshold, ge=0, le=1)
+    iou_threshold: float = Field(config.detector_iou_threshold, ge=0, le=1)
+    max_detections: int = Field(config.detector_max_detections, ge=1)
+    class_agnostic: bool = False
+    soft_nms: bool = False
 
 
 def postprocess(
-    predictions: List[Tuple[float, float, float, float, float, float]],
+    predictions: np.ndarray,
     dim: Tuple[int, int],
-    conf_threshold: float = 0.25,
-) -> List[Tuple[float, float, float, float, float, int]]:
-    predictions_array = np.array(predictions)
+    options: DetectOptions = DetectOptions(),
+) -> List[dict]:
+    predictions_array = np.asarray(predictions)
 
     xs, ys, ws, hs = predictions_array[:4]
     labels = predictions_array[4:]
     # Compute confidence and label index
     confs = np.max(labels, axis=0)
     label_indices = np.argmax(labels, axis=0)
-    mask = confs > conf_threshold
+    mask = confs > options.conf_threshold
 
     # Apply confidence threshold
     filtered_boxes = np.column_stack(
         (xs[mask], ys[mask], ws[mask], hs[mask], confs[mask], label_indices[mask])
     )
 
-    nms_boxes = nms(filtered_boxes, iou_threshold=0.5)
+    nms_boxes = nms(
+        filtered_boxes,
+        iou_threshold=options.iou_threshold,
+        class_agnostic=options.class_agnostic,
+        pre_nms_top_k=config.detector_pre_nms_top_k,
+        max_detections=options.max_detections,
+        soft=options.soft_nms,
+        score_threshold=options.conf_threshold,
+    )
     # print("nms_boxes", nms_boxes)
 
-    scaled_boxes = list(
-        map(lambda box: [*image_scale(box[:4], dim), *box[4:]], nms_boxes)
-    )
+    if len(nms_boxes) == 0:
+        return []
+
+    scaled_boxes = image_scale_boxes(nms_boxes[:, :4], dim, DET_DIM)
     # print("scaled_boxes", scaled_boxes)
 
-    converted_boxes = list(
-        map(
-            lambda box: [
-                *convert_box_format(box[:4], dim, "CCWH", False, "CCWH", True),
-                *box[4:],
-            ],
-            scaled_boxes,
-        )
+    converted_boxes = convert_box_formats(
+        scaled_boxes, dim, "CCWH", False, "CCWH", True
     )
     # print("converted_boxes", converted_boxes)
 
-    labeled_boxes = list(
-        map(
-            lambda box: {
-                "box": box[:4],
-                "confidence": box[4],
-                "category": label_box(box[5]),
-            },
-            converted_boxes,
+    labeled_boxes = [
+        {"box": box, "confidence": confidence, "category": label_box(label)}
+        for box, confidence, label in zip(
+            converted_boxes.tolist(),
+            nms_boxes[:, 4].tolist(),
+            nms_boxes[:, 5].astype(int).tolist(),
         )
-    )
+    ]
     # print("labeled_boxes", labeled_boxes)
 
     return labeled_boxes
 
 
-def predict(image: np.ndarray):
-    preprocessed_image, dim = preprocess(image)
+detector = create_backend(
+    "custom-detector",
+    config.detector_backend,
+    config.detector_model_path,
+    config.detector_timeout,
+    config.detector_input_name,
+    config.detector_input_dtype,
+)
 
-    data = json.dumps({"instances": [preprocessed_image]})
+
+async def predict_batch(instances: List[np.ndarray]) -> np.ndarray:
+    return await detector.predict(np.stack(instances))
+
+
+batcher = MicroBatcher(
+    "custom-detector",
+    predict_batch,
+    max_batch_size=config.detector_max_batch_size,
+    max_wait_ms=config.detector_batch_wait_ms,
+)
+
+
+async def predict(
+    image: np.ndarray,
+    options: DetectOptions = DetectOptions(),
+    dim: Optional[Tuple[int, int]] = None,
+):
+    preprocessed_image, dim = await preprocess(image, dim)
 
     try:
-        detections = httpx.post(
-            f"{config.tensorflow_api_url}/v1/models/custom-detector:predict",
-            data=data,
-        )
+        prediction = await batcher.submit(preprocessed_image)
 
-        return postprocess(detections.json()["predictions"][0], dim)
+        return postprocess(prediction, dim, options)
     except Exception as error:
         print("Failed request Tensorflow Serving /custom-detector:predict", error)
         raise HTTPException(
@@ -98,23 +143,232 @@ def predict(image: np.ndarray):
         )
 
 
-class RequestBody(BaseModel):
+class RequestBody(DetectOptions):
     image: str
 
 
-@router.post("/detect")
-async def detect(request: RequestBody):
+@router.post("/detect", openapi_extra=image_upload_openapi(RequestBody))
+async def detect(request: Request):
     try:
+        # Base64 JSON, a raw image body or a multipart `image` file
+        image_bytes, options = await read_image_upload(
+            request, RequestBody, DetectOptions
+        )
+
+        key = result_key("detect", image_bytes, options.model_dump(exclude={"image"}))
+        result = await result_cache.get(key)
+        if result is not None:
+            return {**result, "meta": {"cached": True}}
+
         id = generate()
-        image_save(id, request.image)
+        # Stores the upload and caches its full-size decode for /embedding
+        # while the detector runs on the reduced one
+        image_array, dim, save_task = await image_ingest(
+            id, image_bytes, config.detector_decode_min_size, cache=True
+        )
+
+        try:
+            objects = await predict(image_array, options, dim)
+        except BaseException:
+            await image_discard(id, save_task)
+            raise
+        await save_task
 
-        image_array = base64_to_array(request.image)
-        objects = predict(image_array)
+        result = {"id": id, "objects": objects}
+        await result_cache.put(key, result)
 
-        return {"id": id, "objects": objects}
+        return {**result, "meta": {"cached": False}}
     except HTTPException as error:
         print("API detect POST", error)
         raise error
     except Exception as error:
         print("API detect POST", error)
         raise HTTPException(status_code=500, detail="Some Unknown Error Found")
+
+
+class BatchRequestBody(DetectOptions):
+    images: List[str] = Field(min_length=1, max_length=config.detector_batch_max_images)
+
+
+def decode_into(
+    image_bytes: bytes, output: np.ndarray
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Decode one upload and letterbox it straight into its slot of the batch
+    tensor.
+
+    Returns:
+        Tuple[np.ndarray, Tuple[int, int]]: Decoded image and its original
+        (height, width).
+    """
+    image_array, dim = bytes_to_array(image_bytes, config.detector_decode_min_size)
+
+    # The batch tensor is RGB, whatever the upload's mode
+    image_resize_into(image_rgb(image_array), output)
+
+    return image_array, dim
+
+
+async def predict_many(
+    instances: np.ndarray, dims: List[Tuple[int, int]], options: DetectOptions
+) -> Tuple[List[List[dict]], int]:
+    """
+    Run the detector on a letterboxed batch, in as few predict calls as
+    `detector_batch_predict_size` allows, then postprocess each image.
+
+    Returns:
+        Tuple[List[List[dict]], int]: Objects per image and the number of
+        predict calls made.
+    """
+    size = max(1, config.detector_batch_predict_size)
+    chunks = [instances[i : i + size] for i in range(0, len(instances), size)]
+
+    try:
+        predictions = await asyncio.gather(*(detector.predict(c) for c in chunks))
+    except Exception as error:
+        print("Failed request Tensorflow Serving /custom-detector:predict", error)
+        raise HTTPException(
+            status_code=500,
+            detail="Failed request Tensorflow Serving /custom-detector:predict",
+        )
+
+    predictions = [prediction for chunk in predictions for prediction in chunk]
+    objects = await asyncio.to_thread(
+        lambda: [
+            postprocess(prediction, dim, options)
+            for prediction, dim in zip(predictions, dims)
+        ]
+    )
+
+    return objects, len(chunks)
+
+
+def read_batch_image(encoded_image: str, options: dict) -> Optional[Tuple[bytes, str]]:
+    """
+    Decode one batch image from base64 and build its result cache key, or
+    None if it is not valid base64.
+    """
+    try:
+        image_bytes = base64_to_bytes(encoded_image)
+    except ValueError:
+        return None
+
+    return image_bytes, result_key("detect", image_bytes, options)
+
+
+def batch_error(status_code: int, detail: str) -> dict:
+    return {"error": {"status": status_code, "detail": detail}}
+
+
+@router.post(
+    "/detect/batch",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": BatchRequestBody.model_json_schema()}
+            },
+        }
+    },
+)
+async def detect_batch(request: Request):
+    try:
+        # Parsed from a body capped while it streams, not buffered unbounded
+        try:
+            batch = BatchRequestBody.model_validate_json(
+                await read_body(request, config.detector_batch_max_bytes)
+            )
+        except ValidationError as error:
+            raise validation_error(error, "body")
+
+        options = batch.model_dump(exclude={"images"})
+        # Base64 decoding and hashing megabytes of uploads stay off the loop
+        uploads = await asyncio.to_thread(
+            lambda: [read_batch_image(image, options) for image in batch.images]
+        )
+
+        valid = [index for index, upload in enumerate(uploads) if upload is not None]
+        hits = await asyncio.gather(
+            *(result_cache.get(uploads[index][1]) for index in valid)
+        )
+        results = [None] * len(uploads)
+        for index, result in zip(valid, hits):
+            results[index] = result
+        cached = [result is not None for result in results]
+
+        for index, upload in enumerate(uploads):
+            if upload is None:
+                results[index] = batch_error(400, "Invalid image uploaded")
+
+        pending = [index for index, result in enumerate(results) if result is None]
+
+        predict_calls = 0
+        if pending:
+            # Every image is decoded in its own thread straight into one
+            # (N, 640, 640, 3) tensor for the detector
+            instances = np.empty((len(pending), DET_DIM[1], DET_DIM[0], 3), np.uint8)
+            decoded = await asyncio.gather(
+                *(
+                    asyncio.to_thread(decode_into, uploads[index][0], instances[slot])
+                    for slot, index in enumerate(pending)
+                ),
+                return_exceptions=True,
+            )
+
+            # An image that fails to decode gets its own error entry and is
+            # neither stored nor predicted
+            slots = []
+            for slot, (index, image) in enumerate(zip(pending, decoded)):
+                if isinstance(image, Exception):
+                    print("API detect batch POST", index, image)
+                    results[index] = batch_error(400, "Invalid image uploaded")
+                else:
+                    slots.append(slot)
+            if len(slots) < len(pending):
+                instances = instances[slots]
+                pending = [pending[slot] for slot in slots]
+                decoded = [decoded[slot] for slot in slots]
+
+            if pending:
+                ids = [generate() for _ in pending]
+                save_tasks = [
+                    asyncio.create_task(image_save(id, uploads[index][0]))
+                    for id, index in zip(ids, pending)
+                ]
+
+                async def cache_all():
+                    # One full-size decode at a time keeps a batch's memory flat
+                    for id, index, (image_array, dim) in zip(ids, pending, decoded):
+                        await image_cache_full(id, uploads[index][0], image_array, dim)
+
+                cache_task = asyncio.create_task(cache_all())
+
+                try:
+                    objects, predict_calls = await predict_many(
+                        instances, [dim for _, dim in decoded], batch
+                    )
+                except BaseException:
+                    cache_task.cancel()
+                    await asyncio.gather(
+                        *(image_discard(id, task) for id, task in zip(ids, save_tasks))
+                    )
+                    raise
+                await asyncio.gather(*save_tasks, cache_task)
+
+                for id, index, image_objects in zip(ids, pending, objects):
+                    results[index] = {"id": id, "objects": image_objects}
+                    await result_cache.put(uploads[index][1], results[index])
+
+        return {
+            "results": [
+                {**result, "meta": {"cached": hit}}
+                for result, hit in zip(results, cached)
+            ],
+            "meta": {"predicted": len(pending), "predict_calls": predict_calls},
+        }
+    except HTTPException as error:
+        print("API detect batch POST", error)
+        raise error
+    except Exception as error:
+        print("API detect batch POST", error)
+        raise HTTPException(status_code=500, detail="Some Unknown Error Found")
@@ -0,0 +1,66 @@
+import asyncio
+from typing import List, Optional
+from fastapi import HTTPException
+
+from .router import router
+
+from server.routes.image import detect, embedding
+from server.utils.base64ToArray import bytes_to_array
+from server.utils.imageUpload import image_from_base64
+from server.utils.resultCache import result_cache, result_key
+
+
+class RequestBody(detect.DetectOptions):
+    image: str
+    # Only embed objects at or above this confidence
+    min_confidence: Optional[float] = None
+    # Only embed objects of these categories
+    categories: Optional[List[str]] = None
+
+
+@router.post("/detect-embed")
+async def detect_embed(request: RequestBody):
+    try:
+        image_bytes = image_from_base64(request.image)
+
+        key = result_key(
+            "detect-embed", image_bytes, request.model_dump(exclude={"image"})
+        )
+        result = await result_cache.get(key)
+        if result is not None:
+            return {**result, "meta": {"cached": True}}
+
+        # Decoded once at full size: the detector letterboxes it down, and
+        # the embedder crops keep the detail /image/embedding would see
+        try:
+            image_array, dim = await asyncio.to_thread(bytes_to_array, image_bytes)
+        except Exception as error:
+            print("API detect-embed POST", error)
+            raise HTTPException(status_code=400, detail="Invalid image uploaded")
+
+        objects = await detect.predict(image_array, request, dim)
+
+        objects = [
+            object
+            for object in objects
+            if (
+                request.min_confidence is None
+                or object["confidence"] >= request.min_confidence
+            )
+            and (request.categories is None or object["category"] in request.categories)
+        ]
+
+        embeddings = await embedding.predict(
+            image_array, [object["box"] for object in objects]
+        )
+
+        result = {"objects": objects, "embeddings": embeddings}
+        await result_cache.put(key, result)
+
+        return {**result, "meta": {"cached": False}}
+    except HTTPException as error:
+        print("API detect-embed POST", error)
+        raise error
+    except Exception as error:
+        print("API detect-embed POST", error)
+        raise HTTPException(status_code=500, detail="Some Unknown Error Found")
@@ -1,50 +1,69 @@
 import asyncio
-import json
-import math
-from typing import List, Tuple
+from typing import List
 from fastapi import HTTPException
 from pydantic import BaseModel
-import httpx
 import numpy as np
-from PIL import Image
 
 from .router import router
 
 from server.core.config import config
-from server.utils.convertBoxFormat import convert_box_format
+from server.core.inference import create_backend
+from server.core.workers import pool
+from server.utils.imageCrop import crop_boxes
 from server.utils.imageLoad import image_load
-from server.utils.imageResize import image_resize
+from server.utils.imageRgb import image_rgb
 
 CLASS_DIM = [256, 256]
 
 
-async def preprocess(images: List[np.ndarray]) -> List[List[float]]:
-    async def process_image(image: np.ndarray) -> List[float]:
-        resized_image = image.tolist()
-        return resized_image
+async def preprocess(image: np.ndarray, boxes: list) -> np.ndarray:
+    # Gray and RGBA images would crop to batches the embedder can't take
+    return await pool.run(crop_boxes, image_rgb(image), boxes, CLASS_DIM)
 
-    resized_images = await asyncio.gather(*[process_image(image) for image in images])
-    # print({"resized_images": resized_images})
 
-    return resized_images
+def postprocess(embeddings: np.ndarray) -> List[List[float]]:
+    return embeddings.tolist()
 
 
-def postprocess(embeddings):
-    return embeddings
+embedder = create_backend(
+    "custom-embedder",
+    config.embedder_backend,
+    config.embedder_model_path,
+    config.embedder_timeout,
+    config.embedder_input_name,
+    config.embedder_input_dtype,
+)
+
+
+async def predict_batches(crops: np.ndarray) -> np.ndarray:
+    # Sub-batches keep each payload bounded; the semaphore bounds model load
+    batch_size = max(1, config.embedder_batch_size)
+    semaphore = asyncio.Semaphore(max(1, config.embedder_concurrency))
+
+    async def predict_batch(batch: np.ndarray) -> np.ndarray:
+        async with semaphore:
+            return await embedder.predict(batch)
+
+    results = await asyncio.gather(
+        *[
+            predict_batch(crops[index : index + batch_size])
+            for index in range(0, len(crops), batch_size)
+        ]
+    )
+
+    return np.concatenate(results)
 
 
 async def predict(image: np.ndarray, boxes: list):
-    image_crops = await crop_image(image, boxes)
-    preprocessed_images = await preprocess(image_crops)
-    data = json.dumps({"instances": preprocessed_images})
+    if len(boxes) == 0:
+        return []
+
+    image_crops = await preprocess(image, boxes)
 
     try:
-        detections = httpx.post(
-            f"{config.tensorflow_api_url}/v1/models/custom-embedder:predict",
-            data=data,
-        )
+        detections = await predict_batches(image_crops)
 
-        embeddings = postprocess(detections.json()["predictions"])
+        embeddings = postprocess(detections)
 
         return embeddings
     except Exception as error:
@@ -55,36 +74,6 @@ async def predict(image: np.ndarray, boxes: list):
         )
 
 
-async def crop_image(
-    image: np.ndarray, boxes: Tuple[float, float, float, float]
-) -> np.ndarray:
-    img = Image.fromarray(image)
-
-    def process_box(box):
-        converted_box = convert_box_format(box, img.size, "CCWH", True, "XYWH", False)
-        converted_box = [math.floor(num) for num in converted_box]
-
-        cropped_image, dim = image_resize(
-            np.array(
-                img.crop(
-                    (
-                        converted_box[0],
-                        converted_box[1],
-                        converted_box[0] + converted_box[2],
-                        converted_box[1] + converted_box[3],
-                    )
-                )
-            ),
-            CLASS_DIM,
-        )
-
-        return cropped_image
-
-    tasks = [asyncio.to_thread(process_box, box) for box in boxes]
-    cropped_images = await asyncio.gather(*tasks)
-    return np.array(cropped_images)
-
-
 class Object(BaseModel):
     box: List[float]
     confidence: float
@@ -98,7 +87,7 @@ class RequestBody(BaseModel):
 @router.post("/embedding")
 async def get_embedding(request: RequestBody):
     try:
-        image = image_load(request.id)
+        image = await image_load(request.id)
 
         embeddings = await predict(
             image, list(map(lambda object: object.box, request.objects))
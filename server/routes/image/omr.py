@@ -1,49 +1,95 @@
-from fastapi import HTTPException
+import asyncio
+import json
+from typing import List, Literal, Optional
+
+import cv2
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
 from nanoid import generate
-from pydantic import BaseModel
+import numpy as np
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import UploadFile
 
 from .router import router
 
-from server.utils.base64ToArray import base64_to_array
-from server.utils.imageSave import image_save
-from server.utils.omrAlignCrop import align_crop
-from server.utils.omrAlignInput import align_inputs
-from server.utils.omrDetectMarkers import detect_markers
-from server.utils.omrDetectQR import detect_qr
-from server.utils.omrExtractData import extract_data
-from server.utils.omrHighlights import get_highlights
+from server.core.config import config
+from server.core.workers import omr_pool
+from server.utils.base64ToArray import bytes_to_array
+from server.utils.imageCache import image_cache
+from server.utils.imageIngest import image_ingest
+from server.utils.imageLoad import image_load
+from server.utils.imageSave import image_discard, image_save
+from server.utils.imageUpload import (
+    image_upload_openapi,
+    read_image_upload,
+    read_multipart,
+    validation_error,
+)
+from server.utils.omrPipeline import omr_pipeline, render_overlay
+from server.utils.pdfToArrays import is_pdf, pdf_page_count, pdf_to_arrays
+from server.utils.resultCache import result_cache, result_key
+
+HighlightsMode = Literal["none", "inline", "deferred"]
+
+
+def overlay_key(id: str) -> str:
+    return f"omr-overlay:{id}"
+
+
+def keep_overlay(id: str, result: dict) -> None:
+    # Deferred highlights stay in memory for GET /image/omr/{id}/highlights
+    overlay = result.pop("overlay", None)
+    if overlay is not None:
+        image_cache.put(overlay_key(id), overlay, overlay["base"].nbytes)
+
+
+class OMROptions(BaseModel):
+    # "inline" returns the overlay with the result, "deferred" keeps it for
+    # GET /image/omr/{id}/highlights and "none" skips it
+    highlights: HighlightsMode = "inline"
 
 
-class RequestBody(BaseModel):
+class RequestBody(OMROptions):
     image: str
 
 
-@router.post("/omr")
-async def omr(request: RequestBody):
+@router.post("/omr", openapi_extra=image_upload_openapi(RequestBody))
+async def omr(request: Request):
     try:
-        id = generate()
-        image_save(id, request.image)
+        # Base64 JSON, a raw image body or a multipart `image` file
+        image_bytes, options = await read_image_upload(request, RequestBody, OMROptions)
+
+        key = result_key("omr", image_bytes, {"highlights": options.highlights})
+        result = await result_cache.get(key)
+        if result is not None:
+            return {**result, "meta": {"cached": True}}
 
-        image_array = base64_to_array(request.image)
+        # Fail fast before decoding when the OMR workers are saturated
+        omr_pool.admit()
 
-        markers = detect_markers(image_array)
-        # print("markers", markers)
-        cropped_image = align_crop(image_array, markers)
-        # print("cropped_image", cropped_image)
-        meta_data = detect_qr(cropped_image)
-        # print("meta_data", meta_data)
+        id = generate()
+        image_array, _, save_task = await image_ingest(id, image_bytes)
 
-        option_count = meta_data["option"]
-        choice_start = meta_data["choice"]["start"]
-        choice_count = meta_data["choice"]["count"]
+        try:
+            result, timing = await omr_pool.run_timed(
+                omr_pipeline, image_array, options.highlights
+            )
+        except BaseException:
+            await image_discard(id, save_task)
+            raise
+        await save_task
 
-        inputs = align_inputs(cropped_image, option_count, choice_start, choice_count)
-        choices = extract_data(cropped_image, inputs)
-        highlights = get_highlights(cropped_image, option_count, inputs, choices)
+        keep_overlay(id, result)
+        result = {"id": id, **result}
+        await result_cache.put(key, result)
 
         return {
-            "data": {"name": meta_data["scale"], "choices": choices},
-            "highlights": highlights,
+            **result,
+            "meta": {
+                "cached": False,
+                "queue_ms": timing["queue"] * 1000,
+                "execution_ms": timing["execution"] * 1000,
+            },
         }
     except HTTPException as error:
         print("API omr POST", error)
@@ -51,3 +97,238 @@ async def omr(request: RequestBody):
     except Exception as error:
         print("API omr POST", error)
         raise HTTPException(status_code=500, detail="Some Unknown Error Found")
+
+
+async def batch_pages(uploads: List[UploadFile]):
+    """
+    Yield `(file, page, source)` for every page of the uploads, reading each
+    file only when its turn comes and decoding one page at a time off the
+    event loop. `source` is the decoded image with its encoded bytes (None
+    for PDF pages), or the error that stopped the file from being read.
+    """
+    for upload in uploads:
+        name = upload.filename
+        data = await upload.read()
+        await upload.close()
+
+        if not is_pdf(data):
+            try:
+                image_array, _ = await asyncio.to_thread(bytes_to_array, data)
+                yield name, 1, (image_array, data)
+            except Exception as error:
+                print("API omr batch POST", name, error)
+                invalid = HTTPException(
+                    status_code=400, detail="Invalid image uploaded"
+                )
+                yield name, 1, invalid
+            continue
+
+        pages = pdf_to_arrays(data, config.omr_pdf_dpi)
+        page = 1
+        while True:
+            try:
+                image_array = await asyncio.to_thread(next, pages, None)
+            except Exception as error:
+                yield name, page, error
+                break
+            if image_array is None:
+                break
+
+            yield name, page, (image_array, None)
+            page += 1
+
+
+async def omr_page(
+    image_array: np.ndarray, image_bytes: Optional[bytes], highlights: str
+) -> dict:
+    id = generate()
+
+    if image_bytes is None:
+        # Rendered PDF pages are stored as JPEG like regular uploads
+        _, buffer = await asyncio.to_thread(cv2.imencode, ".jpg", image_array)
+        image_bytes = buffer.tobytes()
+    save_task = asyncio.create_task(image_save(id, image_bytes))
+
+    try:
+        result = await omr_pool.run(omr_pipeline, image_array, highlights)
+    except BaseException:
+        await image_discard(id, save_task)
+        raise
+    await save_task
+
+    keep_overlay(id, result)
+
+    return {"id": id, **result}
+
+
+async def omr_batch_lines(uploads: List[UploadFile], highlights: str):
+    """
+    Read every page of a batch on the OMR workers and yield one NDJSON line
+    per page as soon as it finishes. A failing page becomes an `error` line
+    without affecting the others. Closes the uploads once done.
+    """
+    # Keep every worker busy with at most one page each in flight, so a
+    # large batch doesn't hold all its pages in memory
+    slots = asyncio.Semaphore(max(omr_pool.processes, 1))
+    lines = asyncio.Queue()
+
+    async def run_page(index, name, page, source):
+        try:
+            if isinstance(source, Exception):
+                raise source
+            line = await omr_page(*source, highlights)
+        except HTTPException as error:
+            line = {"error": {"status": error.status_code, "detail": error.detail}}
+        except Exception as error:
+            print("API omr batch POST", name, page, error)
+            line = {"error": {"status": 500, "detail": "Some Unknown Error Found"}}
+        finally:
+            slots.release()
+
+        await lines.put({"index": index, "file": name, "page": page, **line})
+
+    async def produce():
+        tasks = []
+        pages = batch_pages(uploads)
+        while True:
+            await slots.acquire()
+            try:
+                name, page, source = await anext(pages)
+            except StopAsyncIteration:
+                slots.release()
+                break
+
+            tasks.append(asyncio.create_task(run_page(len(tasks), name, page, source)))
+
+        await asyncio.gather(*tasks)
+        await lines.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (line := await lines.get()) is not None:
+            yield json.dumps(line) + "\n"
+    finally:
+        # Client gone: stop reading pages; pages already on a worker finish
+        producer.cancel()
+        for upload in uploads:
+            await upload.close()
+
+
+async def upload_page_count(upload: UploadFile) -> int:
+    # Only PDFs are read ahead, one at a time, to count their pages
+    if not is_pdf(await upload.read(5)):
+        await upload.seek(0)
+        return 1
+
+    await upload.seek(0)
+    data = await upload.read()
+    await upload.seek(0)
+
+    try:
+        return await asyncio.to_thread(pdf_page_count, data)
+    except HTTPException:
+        # Unreadable files still get their own error line
+        return 1
+
+
+class BatchOptions(BaseModel):
+    highlights: HighlightsMode = "none"
+
+
+BATCH_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                        },
+                        **BatchOptions.model_json_schema()["properties"],
+                    },
+                    "required": ["files"],
+                }
+            }
+        },
+    }
+}
+
+
+@router.post("/omr/batch", openapi_extra=BATCH_OPENAPI)
+async def omr_batch(request: Request):
+    form = None
+    streaming = False
+    try:
+        # Image and PDF files in `files` parts, capped while the body streams
+        form = await read_multipart(
+            request, config.omr_batch_max_bytes, config.omr_batch_max_pages
+        )
+        uploads = [
+            upload for upload in form.getlist("files") if isinstance(upload, UploadFile)
+        ]
+        if not uploads:
+            raise HTTPException(status_code=422, detail="Missing `files` file parts")
+
+        try:
+            fields = {key: value for key, value in form.items() if key != "files"}
+            options = BatchOptions.model_validate(fields)
+        except ValidationError as error:
+            raise validation_error(error, "body")
+
+        page_count = 0
+        for upload in uploads:
+            page_count += await upload_page_count(upload)
+        if page_count > config.omr_batch_max_pages:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Too many pages, at most {config.omr_batch_max_pages}",
+            )
+
+        omr_pool.admit()
+
+        streaming = True
+        return StreamingResponse(
+            omr_batch_lines(uploads, options.highlights),
+            media_type="application/x-ndjson",
+        )
+    except HTTPException as error:
+        print("API omr batch POST", error)
+        raise error
+    except Exception as error:
+        print("API omr batch POST", error)
+        raise HTTPException(status_code=500, detail="Some Unknown Error Found")
+    finally:
+        # Once streaming, the uploads are closed as they are read
+        if form is not None and not streaming:
+            await form.close()
+
+
+@router.get("/omr/{id}/highlights")
+async def omr_highlights(id: str):
+    try:
+        overlay = image_cache.get(overlay_key(id))
+
+        if overlay is None:
+            # Evicted from memory; read the sheet again from the saved upload
+            try:
+                image_array = await image_load(id)
+            except ValueError:
+                raise HTTPException(status_code=404, detail="Image not found")
+
+            omr_pool.admit()
+            result = await omr_pool.run(omr_pipeline, image_array, "deferred")
+            overlay = result["overlay"]
+            image_cache.put(overlay_key(id), overlay, overlay["base"].nbytes)
+
+        highlights = await asyncio.to_thread(render_overlay, overlay)
+
+        return {"id": id, "highlights": highlights}
+    except HTTPException as error:
+        print("API omr highlights GET", error)
+        raise error
+    except Exception as error:
+        print("API omr highlights GET", error)
+        raise HTTPException(status_code=500, detail="Some Unknown Error Found")
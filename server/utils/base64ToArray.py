@@ -1,27 +1,55 @@
 import base64
 from io import BytesIO
+import math
+from typing import Optional, Tuple
 from PIL import Image
 import numpy as np
 
 
-def base64_to_array(encoded_image: str) -> np.ndarray:
+def base64_to_bytes(encoded_image: str) -> bytes:
     """
-    Convert a Base64-encoded image string to a NumPy array.
+    Decode a Base64-encoded image string to its raw file bytes.
 
     Args:
-        base64_string (str): Base64-encoded image string.
+        encoded_image (str): Base64-encoded image string, optionally a data URL.
 
     Returns:
-        np.ndarray: Image represented as a NumPy array.
+        bytes: The encoded image file, e.g. JPEG bytes.
     """
     # Remove the data URL scheme if present
     if encoded_image.startswith("data:image"):
         encoded_image = encoded_image.split(",")[1]
 
-    # Decode the Base64 string into bytes
-    image_bytes = base64.b64decode(encoded_image)
+    return base64.b64decode(encoded_image)
 
-    # Convert bytes to a PIL Image
+
+def bytes_to_array(
+    image_bytes: bytes, min_size: Optional[int] = None
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Decode raw image file bytes to a NumPy array.
+
+    With `min_size`, JPEGs are decoded through DCT scaling at the smallest
+    1/2, 1/4 or 1/8 scale whose longer side is still at least `min_size`.
+    Modes other than L, RGB and RGBA (palette, CMYK, 16-bit, ...) are
+    converted to RGB, so the array always holds pixel values.
+
+    Args:
+        image_bytes (bytes): Encoded image file, e.g. JPEG bytes.
+        min_size (Optional[int]): Smallest acceptable longer side, in pixels.
+
+    Returns:
+        Tuple[np.ndarray, Tuple[int, int]]: Image represented as a NumPy array
+        and the original (height, width) before any reduction.
+    """
     image = Image.open(BytesIO(image_bytes))
+    width, height = image.size
+
+    if min_size and max(width, height) > min_size:
+        scale = min_size / max(width, height)
+        image.draft(image.mode, (math.ceil(width * scale), math.ceil(height * scale)))
+
+    if image.mode not in ("L", "RGB", "RGBA"):
+        image = image.convert("RGB")
 
-    return np.array(image, np.uint8)
+    return np.array(image, np.uint8), (height, width)
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+from server.core.config import config
+
+
+class ImageCache:
+    """
+    Byte-bounded LRU cache with a TTL, keyed by image id.
+
+    Values are usually decoded image arrays; anything else must be put with
+    an explicit `nbytes`. Arrays are stored read-only since they are shared
+    between requests.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.entries: OrderedDict[str, tuple[float, int, Any]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, nbytes, value = entry
+            if expires < time.monotonic():
+                self.pop(key)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def put(self, key: str, value: Any, nbytes: Optional[int] = None) -> None:
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        if nbytes is None:
+            nbytes = value.nbytes
+
+        if self.max_bytes <= 0 or nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.pop(key)
+
+            self.entries[key] = (time.monotonic() + self.ttl, nbytes, value)
+            self.size += nbytes
+
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self.pop(oldest)
+                self.evictions += 1
+
+    def pop(self, key: str) -> None:
+        _, nbytes, _ = self.entries.pop(key)
+        self.size -= nbytes
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+image_cache = ImageCache(config.image_cache_max_bytes, config.image_cache_ttl)
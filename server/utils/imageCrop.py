@@ -0,0 +1,62 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from server.utils.convertBoxFormat import convert_box_formats
+from server.utils.imageResize import image_resize_into
+
+
+def crop_boxes(
+    image: np.ndarray,
+    boxes: Sequence[Sequence[float]],
+    dim: Tuple[int, int],
+    background_color: Tuple[int, int, int] = (255, 255, 255),
+) -> np.ndarray:
+    """
+    Crop normalized CCWH boxes out of an image and letterbox every crop
+    straight into one preallocated batch.
+
+    Args:
+        image (np.ndarray): Source image.
+        boxes (Sequence[Sequence[float]]): Normalized (x_center, y_center,
+            width, height) boxes.
+        dim (Tuple[int, int]): Crop (width, height).
+        background_color (Tuple[int, int, int]): Letterbox padding color.
+
+    Returns:
+        np.ndarray: Batch of shape (N, height, width[, channels]).
+    """
+    height, width = image.shape[:2]
+    crop_width, crop_height = dim
+
+    batch = np.empty(
+        (len(boxes), crop_height, crop_width, *image.shape[2:]), dtype=image.dtype
+    )
+    if len(boxes) == 0:
+        return batch
+
+    xywh = np.floor(
+        convert_box_formats(boxes, (width, height), "CCWH", True, "XYWH", False)
+    ).astype(int)
+    corners = np.hstack((xywh[:, :2], xywh[:, :2] + xywh[:, 2:]))
+    inside = np.hstack((corners[:, :2].clip(0), corners[:, 2:]))
+    inside[:, 0::2] = inside[:, 0::2].clip(max=width)
+    inside[:, 1::2] = inside[:, 1::2].clip(max=height)
+
+    for index, ((x1, y1, x2, y2), (ix1, iy1, ix2, iy2)) in enumerate(
+        zip(corners, inside)
+    ):
+        crop = image[iy1:iy2, ix1:ix2]
+
+        if (x1, y1, x2, y2) != (ix1, iy1, ix2, iy2):
+            # Like PIL's crop, the part of the box past the image edge is black
+            window = np.zeros(
+                (max(y2 - y1, 0), max(x2 - x1, 0), *image.shape[2:]), image.dtype
+            )
+            if ix2 > ix1 and iy2 > iy1:
+                window[iy1 - y1 : iy2 - y1, ix1 - x1 : ix2 - x1] = crop
+            crop = window
+
+        image_resize_into(crop, batch[index], background_color)
+
+    return batch
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+import numpy as np
+
+from server.utils.base64ToArray import bytes_to_array
+from server.utils.imageCache import image_cache
+from server.utils.imageSave import image_discard, image_save
+
+
+async def image_cache_full(
+    id: str, image_bytes: bytes, image_array: np.ndarray, dim: Tuple[int, int]
+) -> None:
+    """
+    Keep the full-resolution decode of an upload for `image_load`. A reduced
+    decode is never cached, since `image_load` would then answer differently
+    depending on whether the entry is still cached; the upload is decoded
+    again at full size instead.
+
+    Args:
+        id (str): Image id the upload is stored under.
+        image_bytes (bytes): Encoded image file.
+        image_array (np.ndarray): The decode already made for the model.
+        dim (Tuple[int, int]): Original (height, width) of the upload.
+    """
+    if image_array.shape[:2] != tuple(dim):
+        channels = image_array.shape[2] if image_array.ndim == 3 else 1
+        if dim[0] * dim[1] * channels > image_cache.max_bytes:
+            return
+
+        try:
+            image_array, _ = await asyncio.to_thread(bytes_to_array, image_bytes)
+        except Exception as error:
+            print("Failed to cache image", id, error)
+            return
+
+    image_cache.put(id, image_array)
+
+
+async def image_ingest(
+    id: str, image_bytes: bytes, min_size: Optional[int] = None, cache: bool = False
+) -> Tuple[np.ndarray, Tuple[int, int], asyncio.Task]:
+    """
+    Decode an uploaded image once for both the writer and the model path.
+
+    The file bytes go to the image store while the pixels are decoded off
+    the event loop. Await the returned task before answering so the image
+    is stored, and with `cache` also in memory, for follow-up requests.
+
+    Args:
+        id (str): Image id to store the upload under.
+        image_bytes (bytes): Encoded image file, e.g. JPEG bytes.
+        min_size (Optional[int]): Decode JPEGs at a reduced scale whose longer
+            side is still at least this size.
+        cache (bool): Also keep the full-resolution decode in `image_cache`,
+            decoding it again next to the save when `min_size` reduced it.
+
+    Returns:
+        Tuple[np.ndarray, Tuple[int, int], asyncio.Task]: Decoded image, its
+        original (height, width) and the pending save.
+    """
+    save = asyncio.create_task(image_save(id, image_bytes))
+    try:
+        image_array, dim = await asyncio.to_thread(
+            bytes_to_array, image_bytes, min_size
+        )
+    except Exception as error:
+        print("Failed to decode image", id, error)
+        await image_discard(id, save)
+        raise HTTPException(status_code=400, detail="Invalid image uploaded")
+
+    if not cache:
+        return image_array, dim, save
+
+    async def save_and_cache():
+        await asyncio.gather(save, image_cache_full(id, image_bytes, image_array, dim))
+
+    return image_array, dim, asyncio.create_task(save_and_cache())
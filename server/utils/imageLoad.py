@@ -1,13 +1,35 @@
-from PIL import Image
+import asyncio
+import os
+
 import numpy as np
 
+from server.core.config import config
+from server.utils.base64ToArray import bytes_to_array
+from server.utils.imageCache import image_cache
+from server.utils.imageStore import image_store
+
+
+def legacy_image_bytes(id: str) -> bytes:
+    # Uploads saved before the image store, flat as `{id}.jpg`
+    if os.path.basename(id) != id:
+        raise FileNotFoundError(id)
+
+    with open(os.path.join(config.image_store_path, f"{id}.jpg"), "rb") as file:
+        return file.read()
+
+
+async def image_load(id: str) -> np.ndarray:
+    image_array = image_cache.get(id)
+    if image_array is not None:
+        return image_array
 
-def image_load(id: str, input_path: str = "./assets/images") -> np.ndarray:
     try:
-        image_array = Image.open(f"{input_path}/{id}.jpg")
-        image_array = np.array(image_array)
+        image_bytes = await image_store.load(id)
+        if image_bytes is None:
+            image_bytes = await asyncio.to_thread(legacy_image_bytes, id)
+
+        image_array, _ = await asyncio.to_thread(bytes_to_array, image_bytes)
 
-        print(f"Image load successfully to {input_path}/{id}.jpg")
         return image_array
     except Exception as e:
         raise ValueError(f"Failed to load image: {e}")
@@ -4,13 +4,21 @@ import cv2
 import numpy as np
 
 
-def image_resize(
-    image: np.ndarray,
-    dim: Tuple[int, int],
-    background_color: Tuple[int, int, int] = (255, 255, 255),
-) -> Tuple[np.ndarray, Tuple[int, int]]:
-    # Get original dimensions
-    h, w = image.shape[:2]
+def letterbox_geometry(
+    image_dim: Tuple[int, int], dim: Tuple[int, int]
+) -> Tuple[int, int, int, int]:
+    """
+    Compute how an image fits a target size while keeping its aspect ratio.
+
+    Args:
+        image_dim (Tuple[int, int]): Source (height, width).
+        dim (Tuple[int, int]): Target (width, height).
+
+    Returns:
+        Tuple[int, int, int, int]: Resized width and height, then top and
+        left padding.
+    """
+    h, w = image_dim
     target_width, target_height = dim
 
     # Calculate aspect ratios
@@ -25,24 +33,66 @@ def image_resize(
         new_height = target_height
         new_width = int(target_height * aspect_ratio)
 
-    # Resize the image to fit the target dimensions while maintaining the aspect ratio
-    resized_image = cv2.resize(image, (new_width, new_height))
-
-    # Add padding (borders) to make it the correct size
     top = (target_height - new_height) // 2
-    bottom = target_height - new_height - top
     left = (target_width - new_width) // 2
-    right = target_width - new_width - left
-
-    # Add borders using the background color
-    bordered_image = cv2.copyMakeBorder(
-        resized_image,
-        top,
-        bottom,
-        left,
-        right,
-        cv2.BORDER_CONSTANT,
-        value=background_color,
+
+    return new_width, new_height, top, left
+
+
+def image_letterbox(
+    image: np.ndarray,
+    dim: Tuple[int, int],
+    background_color: Tuple[int, int, int] = (255, 255, 255),
+) -> np.ndarray:
+    """
+    Letterbox an image into a new (height, width[, channels]) array, keeping
+    its aspect ratio. Module level so it can run in a worker process.
+    """
+    output_shape = (dim[1], dim[0]) + image.shape[2:]
+    output = np.empty(output_shape, dtype=image.dtype)
+    image_resize_into(image, output, background_color)
+
+    return output
+
+
+def image_resize_into(
+    image: np.ndarray,
+    output: np.ndarray,
+    background_color: Tuple[int, int, int] = (255, 255, 255),
+) -> Tuple[int, int]:
+    """
+    Letterbox an image straight into a preallocated output slice, without
+    intermediate copies.
+
+    Args:
+        image (np.ndarray): Source image.
+        output (np.ndarray): Destination of shape (height, width[, channels]),
+            e.g. one entry of a batch buffer.
+        background_color (Tuple[int, int, int]): Padding color.
+
+    Returns:
+        Tuple[int, int]: Original (height, width) of the source image.
+    """
+    h, w = image.shape[:2]
+    target_height, target_width = output.shape[:2]
+
+    channels = output.shape[2] if output.ndim == 3 else 1
+    output[...] = (tuple(background_color) + (0,) * channels)[:channels]
+
+    # An empty source leaves only the background
+    if h == 0 or w == 0:
+        return h, w
+
+    new_width, new_height, top, left = letterbox_geometry(
+        (h, w), (target_width, target_height)
     )
 
-    return bordered_image, (h, w)
+    if new_width > 0 and new_height > 0:
+        # cv2 writes into the strided view in place when shape and type match
+        cv2.resize(
+            image,
+            (new_width, new_height),
+            dst=output[top : top + new_height, left : left + new_width],
+        )
+
+    return h, w
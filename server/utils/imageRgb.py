@@ -0,0 +1,22 @@
+import cv2
+import numpy as np
+
+
+def image_rgb(image: np.ndarray) -> np.ndarray:
+    """
+    Bring a decoded upload to 3-channel RGB, as the models expect.
+
+    Args:
+        image (np.ndarray): Grayscale, RGB or RGBA image.
+
+    Returns:
+        np.ndarray: The RGB image; RGB input is returned as is.
+    """
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    if image.shape[2] == 1:
+        return cv2.cvtColor(image[..., 0], cv2.COLOR_GRAY2RGB)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
+
+    return image
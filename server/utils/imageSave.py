@@ -1,18 +1,28 @@
-import base64
+import asyncio
 
+from server.utils.base64ToArray import base64_to_bytes
+from server.utils.imageStore import image_store
 
-def image_save(
-    id: str, encoded_image: str, output_path: str = "./assets/images"
-) -> None:
-    try:
-        if encoded_image.startswith("data:image"):
-            encoded_image = encoded_image.split(",")[1]
-
-        image_data = base64.b64decode(encoded_image)
 
-        with open(f"{output_path}/{id}.jpg", "wb") as image_file:
-            image_file.write(image_data)
+async def image_save(id: str, image_data: bytes | str) -> None:
+    try:
+        if isinstance(image_data, str):
+            image_data = base64_to_bytes(image_data)
 
-        print(f"Image saved successfully to {output_path}/{id}.jpg")
+        await image_store.save(id, image_data)
     except Exception as e:
         raise ValueError(f"Failed to save image: {e}")
+
+
+async def image_discard(id: str, save_task: asyncio.Task) -> None:
+    """
+    Settle the save of an upload whose request failed, then forget its id,
+    which was never returned to the client.
+    """
+    try:
+        await save_task
+    except Exception as error:
+        print("Failed to save image", id, error)
+        return
+
+    await image_store.delete(id)
@@ -1,25 +1,31 @@
 from typing import Tuple
 
+import numpy as np
 
-def image_scale(
-    box: Tuple[float, float, float, float], dim: Tuple[int, int]
-) -> Tuple[float, float, float, float]:
-    x_center, y_center, width, height, *_ = box
 
-    DET_DIM = (640, 640)  # Example DET_DIM value
-    factor = max(dim) / max(DET_DIM)
+def image_scale_boxes(
+    boxes: np.ndarray, dim: Tuple[int, int], det_dim: Tuple[int, int]
+) -> np.ndarray:
+    """
+    Map (N,4) CCWH boxes from the letterboxed detector input back to the
+    original image, in one pass.
+
+    Args:
+        boxes (np.ndarray): Boxes as rows of (x_center, y_center, width, height).
+        dim (Tuple[int, int]): Original image (height, width).
+        det_dim (Tuple[int, int]): Detector input dimensions.
+
+    Returns:
+        np.ndarray: Scaled boxes, a new (N,4) float array.
+    """
+    factor = max(dim) / max(det_dim)
     offset = abs(dim[0] - dim[1])
 
-    x_center *= factor
-    y_center *= factor
-    width *= factor
-    height *= factor
+    scaled_boxes = np.asarray(boxes, dtype=np.float64)[:, :4] * factor
 
     if dim[0] > dim[1]:
-        y_center -= offset / 2
+        scaled_boxes[:, 1] -= offset / 2
     elif dim[0] < dim[1]:
-        x_center -= offset / 2
-
-    scaled_box = [x_center, y_center, width, height]
+        scaled_boxes[:, 0] -= offset / 2
 
-    return scaled_box
+    return scaled_boxes
@@ -0,0 +1,275 @@
+from abc import ABC, abstractmethod
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from server.core.config import config
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def shard_path(digest: str) -> str:
+    # Two levels of 256 directories keep every directory small
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+class ImageIndex:
+    """
+    SQLite table mapping image ids to the content hash of their blob. The
+    database is opened on first use, so importing the store touches no
+    files.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        # Called with the lock held
+        if self.connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            with connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS images ("
+                    "id TEXT PRIMARY KEY, hash TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "created REAL NOT NULL)"
+                )
+            self.connection = connection
+
+        return self.connection
+
+    def get(self, id: str) -> Optional[str]:
+        with self.lock:
+            row = (
+                self.connect()
+                .execute("SELECT hash FROM images WHERE id = ?", (id,))
+                .fetchone()
+            )
+
+        return row[0] if row is not None else None
+
+    def put(self, id: str, digest: str, size: int) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO images (id, hash, size, created) "
+                    "VALUES (?, ?, ?, ?)",
+                    (id, digest, size, time.time()),
+                )
+
+    def remove(self, id: str) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute("DELETE FROM images WHERE id = ?", (id,))
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+class ImageStore(ABC):
+    """
+    Content-addressed image store. Uploads are kept once per distinct
+    content under their SHA-256, and an index maps every image id to its
+    blob, so identical uploads share storage.
+
+    Backends implement `exists`, `read` and `write` for blobs by hash.
+    """
+
+    def __init__(self, index: ImageIndex):
+        self.index = index
+
+        self.saved = 0
+        self.deduplicated = 0
+        self.loaded = 0
+
+    def put(self, id: str, data: bytes) -> str:
+        """
+        Store an image under an id.
+
+        Args:
+            id (str): Image id.
+            data (bytes): Encoded image file.
+
+        Returns:
+            str: Content hash of the stored blob.
+        """
+        digest = content_hash(data)
+
+        if self.exists(digest):
+            self.deduplicated += 1
+        else:
+            self.write(digest, data)
+        self.saved += 1
+
+        # Only indexed once the blob is in place, so ids never dangle
+        self.index.put(id, digest, len(data))
+
+        return digest
+
+    def get(self, id: str) -> Optional[bytes]:
+        """
+        Read the encoded image stored under an id, None if unknown.
+        """
+        digest = self.index.get(id)
+        if digest is None:
+            return None
+
+        data = self.read(digest)
+        if data is not None:
+            self.loaded += 1
+
+        return data
+
+    def remove(self, id: str) -> None:
+        """
+        Forget an image id. Its blob stays, since other ids may share it.
+        """
+        self.index.remove(id)
+
+    async def save(self, id: str, data: bytes) -> str:
+        return await asyncio.to_thread(self.put, id, data)
+
+    async def delete(self, id: str) -> None:
+        await asyncio.to_thread(self.remove, id)
+
+    async def load(self, id: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.get, id)
+
+    def close(self) -> None:
+        self.index.close()
+
+    @abstractmethod
+    def exists(self, digest: str) -> bool: ...
+
+    @abstractmethod
+    def read(self, digest: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    def write(self, digest: str, data: bytes) -> None: ...
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "saved": self.saved,
+            "deduplicated": self.deduplicated,
+            "loaded": self.loaded,
+        }
+
+
+class LocalImageStore(ImageStore):
+    """
+    Blobs on the local disk, sharded by hash prefix.
+    """
+
+    def __init__(self, index: ImageIndex, path: str):
+        super().__init__(index)
+        self.path = path
+
+    def blob_path(self, digest: str) -> str:
+        return f"{self.path}/{shard_path(digest)}"
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.blob_path(digest))
+
+    def read(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self.blob_path(digest), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, digest: str, data: bytes) -> None:
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+        # Write then rename so readers never see a partial file
+        temp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, blob_path)
+
+
+class S3ImageStore(ImageStore):
+    """
+    Blobs in an S3-compatible bucket (AWS, MinIO, R2, ...), sharded by hash
+    prefix. Credentials come from the usual AWS environment variables.
+    """
+
+    def __init__(self, index: ImageIndex, bucket: str, prefix: str = "", client=None):
+        super().__init__(index)
+        self.bucket = bucket
+        self.prefix = prefix
+
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("s3 image store requires the `boto3` package")
+
+            client = boto3.client(
+                "s3",
+                endpoint_url=config.image_store_s3_endpoint_url or None,
+                region_name=config.image_store_s3_region or None,
+            )
+        self.client = client
+
+    def blob_key(self, digest: str) -> str:
+        return f"{self.prefix}{shard_path(digest)}"
+
+    def exists(self, digest: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.blob_key(digest))
+            return True
+        except self.client.exceptions.ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise
+
+    def read(self, digest: str) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.blob_key(digest)
+            )
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+        return response["Body"].read()
+
+    def write(self, digest: str, data: bytes) -> None:
+        # S3 only makes an object visible once it is fully uploaded
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.blob_key(digest),
+            Body=data,
+            ContentType="application/octet-stream",
+        )
+
+
+def create_image_store(backend: str) -> ImageStore:
+    index = ImageIndex(config.image_store_index_path)
+
+    if backend == "s3":
+        return S3ImageStore(
+            index, config.image_store_s3_bucket, config.image_store_s3_prefix
+        )
+
+    return LocalImageStore(index, config.image_store_path)
+
+
+image_store = create_image_store(config.image_store_backend)
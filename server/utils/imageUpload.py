@@ -0,0 +1,174 @@
+import json
+from typing import AsyncIterator, Tuple, Type
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from server.core.config import config
+from server.utils.base64ToArray import base64_to_bytes
+
+
+async def stream_body(request: Request, max_bytes: int) -> AsyncIterator[bytes]:
+    """
+    Stream the request body, failing with 413 as soon as it grows past
+    `max_bytes` instead of after reading it all.
+    """
+    too_large = HTTPException(
+        status_code=413, detail=f"Upload too large, at most {max_bytes} bytes"
+    )
+
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            declared = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if declared > max_bytes:
+            raise too_large
+
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise too_large
+        yield chunk
+
+
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    """
+    Read the whole request body, failing with 413 past `max_bytes`.
+    """
+    return b"".join([chunk async for chunk in stream_body(request, max_bytes)])
+
+
+async def read_multipart(request: Request, max_bytes: int, max_files: int) -> FormData:
+    """
+    Parse a multipart body as it streams in, capped at `max_bytes`. File
+    parts spool to disk past 1MB, so only small files stay in memory until
+    they are read. Close the returned form once done with its files.
+    """
+    parser = MultiPartParser(
+        request.headers, stream_body(request, max_bytes), max_files=max_files
+    )
+    try:
+        return await parser.parse()
+    except MultiPartException as error:
+        raise HTTPException(status_code=400, detail=error.message)
+
+
+def validation_error(error: ValidationError, location: str) -> HTTPException:
+    # Same body as FastAPI's own request validation errors
+    detail = json.loads(error.json(include_url=False))
+    for item in detail:
+        item["loc"] = [location, *item["loc"]]
+
+    return HTTPException(status_code=422, detail=detail)
+
+
+def image_from_base64(image: str) -> bytes:
+    """
+    Decode the base64 `image` of a JSON body, failing with the same 422 body
+    as its validation errors.
+    """
+    try:
+        return base64_to_bytes(image)
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail=[
+                {
+                    "type": "value_error",
+                    "loc": ["body", "image"],
+                    "msg": "Value error, invalid base64 image",
+                }
+            ],
+        )
+
+
+async def read_image_upload(
+    request: Request, body_model: Type[BaseModel], options_model: Type[BaseModel]
+) -> Tuple[bytes, BaseModel]:
+    """
+    Read an image upload in any of the accepted body formats:
+
+    - `application/json`: `body_model`, with the image base64 in `image`
+    - `application/octet-stream` (or `image/*`): the raw image file, options
+      in the query string
+    - `multipart/form-data`: the image file in the `image` part, options as
+      the other form fields
+
+    Args:
+        request (Request): The incoming request.
+        body_model (Type[BaseModel]): JSON body model with an `image` field.
+        options_model (Type[BaseModel]): The options without the image.
+
+    Returns:
+        Tuple[bytes, BaseModel]: The encoded image file and the parsed
+        options.
+    """
+    max_bytes = config.max_upload_bytes
+    location = "body"
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+
+    try:
+        if content_type in ("", "application/json"):
+            options = body_model.model_validate_json(
+                await read_body(request, max_bytes)
+            )
+            return image_from_base64(options.image), options
+
+        if content_type == "application/octet-stream" or content_type.startswith(
+            "image/"
+        ):
+            image_bytes = await read_body(request, max_bytes)
+            location = "query"
+            options = options_model.model_validate(dict(request.query_params))
+            return image_bytes, options
+
+        if content_type == "multipart/form-data":
+            form = await read_multipart(request, max_bytes, max_files=1)
+
+            try:
+                upload = form.get("image")
+                if not isinstance(upload, UploadFile):
+                    raise HTTPException(
+                        status_code=422, detail="Missing `image` file part"
+                    )
+
+                fields = {key: value for key, value in form.items() if key != "image"}
+                options = options_model.model_validate(fields)
+                return await upload.read(), options
+            finally:
+                await form.close()
+    except ValidationError as error:
+        raise validation_error(error, location)
+
+    raise HTTPException(
+        status_code=415, detail=f"Unsupported content type {content_type}"
+    )
+
+
+def image_upload_openapi(body_model: Type[BaseModel]) -> dict:
+    """
+    OpenAPI request body for routes reading `read_image_upload`.
+    """
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": body_model.model_json_schema()},
+                "application/octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                },
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"image": {"type": "string", "format": "binary"}},
+                        "required": ["image"],
+                    }
+                },
+            },
+        }
+    }
@@ -1,57 +1,156 @@
+from typing import Optional
+
 import numpy as np
 
+# Above this many candidates the (N,N) IoU matrix costs more than it saves
+MATRIX_NMS_LIMIT = 512
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    Compute the pairwise Intersection over Union of two sets of boxes.
+
+    Args:
+        boxes_a: (N,4) array of boxes as (x1, y1, x2, y2).
+        boxes_b: (M,4) array of boxes as (x1, y1, x2, y2).
+
+    Returns:
+        (N,M) array of IoU values.
+    """
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    overlap = np.clip(bottom_right - top_left, 0, None)
+    intersection = overlap[..., 0] * overlap[..., 1]
+
+    union = area_a[:, None] + area_b[None, :] - intersection
+
+    return np.divide(
+        intersection, union, out=np.zeros_like(intersection), where=union > 0
+    )
+
+
+def _greedy_matrix(corners: np.ndarray, iou_threshold: float, limit: int) -> list:
+    # One IoU matrix up front, then walk it row by row
+    iou = box_iou(corners, corners)
+    suppressed = np.zeros(len(corners), dtype=bool)
+
+    pick = []
+    for i in range(len(corners)):
+        if len(pick) >= limit:
+            break
+        if suppressed[i]:
+            continue
+        pick.append(i)
+        suppressed |= iou[i] > iou_threshold
+
+    return pick
 
-def nms(boxes: np.ndarray, iou_threshold: float) -> np.ndarray:
+
+def _greedy(corners: np.ndarray, iou_threshold: float, limit: int) -> list:
+    # IoU of the current best against the survivors only
+    order = np.arange(len(corners))
+
+    pick = []
+    while len(order) > 0 and len(pick) < limit:
+        i = order[0]
+        pick.append(i)
+
+        rest = order[1:]
+        iou = box_iou(corners[i : i + 1], corners[rest])[0]
+        order = rest[iou <= iou_threshold]
+
+    return pick
+
+
+def _soft(
+    corners: np.ndarray,
+    scores: np.ndarray,
+    sigma: float,
+    score_threshold: float,
+    limit: int,
+) -> tuple[list, np.ndarray]:
+    # Gaussian soft-NMS: decay overlapping scores instead of dropping boxes
+    scores = scores.copy()
+    alive = np.ones(len(corners), dtype=bool)
+
+    pick = []
+    while alive.any() and len(pick) < limit:
+        i = np.argmax(np.where(alive, scores, -np.inf))
+        if scores[i] < score_threshold:
+            break
+        pick.append(i)
+        alive[i] = False
+
+        iou = box_iou(corners[i : i + 1], corners)[0]
+        scores = np.where(alive, scores * np.exp(-(iou**2) / sigma), scores)
+
+    return pick, scores
+
+
+def nms(
+    boxes: np.ndarray,
+    iou_threshold: float,
+    class_agnostic: bool = False,
+    pre_nms_top_k: Optional[int] = None,
+    max_detections: Optional[int] = None,
+    soft: bool = False,
+    sigma: float = 0.5,
+    score_threshold: float = 0.001,
+) -> np.ndarray:
     """
     Perform Non-Maximum Suppression (NMS) on the bounding boxes.
 
     Args:
         boxes: Array of bounding boxes with each row as (x, y, w, h, conf, label).
         iou_threshold: Intersection over Union (IoU) threshold for NMS.
+        class_agnostic: Suppress across labels instead of within each label.
+        pre_nms_top_k: Keep only the k most confident candidates before NMS.
+        max_detections: Stop once this many boxes have been picked.
+        soft: Use Gaussian soft-NMS, decaying scores rather than discarding.
+        sigma: Gaussian width for soft-NMS.
+        score_threshold: Minimum decayed score kept by soft-NMS.
 
     Returns:
-        Array of bounding boxes after NMS.
+        Array of bounding boxes after NMS, most confident first. With soft-NMS
+        the confidence column holds the decayed scores.
     """
     if len(boxes) == 0:
-        return np.array([])
+        return np.empty((0, 6))
 
-    # Initialize the list of picked indexes
-    pick = []
+    boxes = np.asarray(boxes, dtype=np.float64)
+    scores = boxes[:, 4]
 
-    # Extract coordinates and confidence scores
-    x1 = boxes[:, 0] - boxes[:, 2] / 2
-    y1 = boxes[:, 1] - boxes[:, 3] / 2
-    x2 = boxes[:, 0] + boxes[:, 2] / 2
-    y2 = boxes[:, 1] + boxes[:, 3] / 2
-    confs = boxes[:, 4]
-
-    # Compute the area of the bounding boxes and sort by confidence
-    area = (x2 - x1) * (y2 - y1)
-    idxs = np.argsort(confs)[::-1]
-
-    # Iterate while some indexes remain
-    while len(idxs) > 0:
-        # Grab the index of the current highest confidence
-        i = idxs[0]
-        pick.append(i)
+    # Sort by confidence, keeping only the top-k candidates
+    if pre_nms_top_k is not None and len(boxes) > pre_nms_top_k:
+        top = np.argpartition(-scores, pre_nms_top_k - 1)[:pre_nms_top_k]
+        order = top[np.argsort(-scores[top], kind="stable")]
+    else:
+        order = np.argsort(-scores, kind="stable")
+    boxes = boxes[order]
+
+    corners = np.hstack(
+        (boxes[:, :2] - boxes[:, 2:4] / 2, boxes[:, :2] + boxes[:, 2:4] / 2)
+    )
 
-        # Compute IoU between the picked box and the rest
-        xx1 = np.maximum(x1[i], x1[idxs[1:]])
-        yy1 = np.maximum(y1[i], y1[idxs[1:]])
-        xx2 = np.minimum(x2[i], x2[idxs[1:]])
-        yy2 = np.minimum(y2[i], y2[idxs[1:]])
+    if not class_agnostic:
+        # Shift each label into its own region so labels never overlap
+        offset = corners.max() - corners.min() + 1
+        corners = corners + (boxes[:, 5:6] * offset)
 
-        # Compute width and height of the overlap
-        w = np.maximum(0, xx2 - xx1)
-        h = np.maximum(0, yy2 - yy1)
+    limit = max_detections if max_detections is not None else len(boxes)
 
-        # Compute the ratio of overlap (IoU)
-        overlap = (w * h) / area[idxs[1:]]
+    if soft:
+        pick, decayed = _soft(corners, boxes[:, 4], sigma, score_threshold, limit)
+        picked = boxes[pick]
+        picked[:, 4] = decayed[pick]
+        return picked
 
-        # Delete indexes with IoU above the threshold
-        idxs = np.delete(
-            idxs, np.concatenate(([0], np.where(overlap > iou_threshold)[0] + 1))
-        )
+    if len(boxes) <= MATRIX_NMS_LIMIT:
+        pick = _greedy_matrix(corners, iou_threshold, limit)
+    else:
+        pick = _greedy(corners, iou_threshold, limit)
 
-    # Return the boxes that were picked
     return boxes[pick]
@@ -2,26 +2,59 @@ import cv2
 import numpy as np
 
 from server.utils.omrDetectMarkers import detect_markers
+from server.utils.omrLayout import sheet_frame
+from server.utils.omrSheet import OMRSheet, as_sheet
 
-DEST_MARKERS = [
-    {"id": 1, "positions": [69.5, 69.5]},
-    {"id": 2, "positions": [2309.5, 69.5]},
-    {"id": 3, "positions": [69.5, 389.5]},
-    {"id": 4, "positions": [1189.5, 389.5]},
-    {"id": 5, "positions": [2309.5, 389.5]},
-    {"id": 6, "positions": [69.5, 1839.5]},
-    {"id": 7, "positions": [1189.5, 1839.5]},
-    {"id": 8, "positions": [2309.5, 1839.5]},
-    {"id": 9, "positions": [69.5, 3289.5]},
-    {"id": 10, "positions": [1189.5, 3289.5]},
-    {"id": 11, "positions": [2309.5, 3289.5]},
-]
+# Markers needed to fit the sheet homography in one pass, and the largest
+# reprojection error (sheet pixels) for which that fit is trusted
+DIRECT_MIN_MARKERS = 6
+REPROJECTION_THRESHOLD = 2.0
 
-DIM = [2380, 3368]
 
+def direct_homography(src_markers):
+    """
+    Fit the sheet homography straight from the markers found on the photo.
 
-def align_crop(image, src_markers):
-    width, height = DIM
+    Returns:
+        Optional[np.ndarray]: The homography onto the sheet frame's markers,
+        or None when too few markers were found or they don't fit within
+        REPROJECTION_THRESHOLD.
+    """
+    dest_positions = sheet_frame().markers
+    pairs = [
+        (marker["positions"], dest_positions[marker["id"]])
+        for marker in src_markers
+        if marker["id"] in dest_positions
+    ]
+    if len(pairs) < DIRECT_MIN_MARKERS:
+        return None
+
+    src_points = np.array([src for src, _ in pairs], dtype=np.float32)
+    dest_points = np.array([dest for _, dest in pairs], dtype=np.float32)
+
+    homography, _ = cv2.findHomography(src_points, dest_points, cv2.RANSAC, 5.0)
+    if homography is None:
+        return None
+
+    projected = cv2.perspectiveTransform(src_points[None], homography)[0]
+    error = np.linalg.norm(projected - dest_points, axis=1).max()
+    if error > REPROJECTION_THRESHOLD:
+        return None
+
+    return homography
+
+
+def align_crop(image, src_markers) -> OMRSheet:
+    frame = sheet_frame()
+    width, height = frame.size
+    # Every later stage reads grayscale, so only that gets warped
+    image = as_sheet(image).gray
+
+    # One warp when the first pass already fits the template; otherwise
+    # crop to the corners and detect the markers again on the flat sheet
+    homography = direct_homography(src_markers)
+    if homography is not None:
+        return OMRSheet(cv2.warpPerspective(image, homography, (width, height)))
 
     corners = []
     for target_key in [1, 2, 11, 9]:
@@ -43,7 +76,9 @@ def align_crop(image, src_markers):
     )
 
     transform_matrix = cv2.getPerspectiveTransform(src_points, dest_points)
-    cropped_image = cv2.warpPerspective(image, transform_matrix, (width, height))
+    cropped_image = OMRSheet(
+        cv2.warpPerspective(image, transform_matrix, (width, height))
+    )
     # cv2.imwrite("./assets/images/cropped_image.jpg", cropped_image)
 
     src_markers = [
@@ -51,37 +86,25 @@ def align_crop(image, src_markers):
         for element in detect_markers(cropped_image)
         if element["id"] in [3, 5, 7, 9, 11]
     ]
-    dest_markers = DEST_MARKERS
-
     src_points = np.array(
         [
             src_marker["positions"]
             for src_marker in src_markers
-            if (
-                dest_marker := next(
-                    (d for d in dest_markers if d["id"] == src_marker["id"]), None
-                )
-            )
-            is not None
+            if src_marker["id"] in frame.markers
         ]
     )
     dest_points = np.array(
         [
-            dest_marker["positions"]
+            frame.markers[src_marker["id"]]
             for src_marker in src_markers
-            if (
-                dest_marker := next(
-                    (d for d in dest_markers if d["id"] == src_marker["id"]), None
-                )
-            )
-            is not None
+            if src_marker["id"] in frame.markers
         ]
     )
 
     # print("src_points", src_points, "dest_points", dest_points)
 
     homography, _ = cv2.findHomography(src_points, dest_points, cv2.RANSAC, 5.0)
-    warped_image = cv2.warpPerspective(cropped_image, homography, (width, height))
+    warped_image = cv2.warpPerspective(cropped_image.gray, homography, (width, height))
     # cv2.imwrite("./assets/images/aligned_image.jpg", warped_image)
 
-    return warped_image
+    return OMRSheet(warped_image)
@@ -4,69 +4,79 @@ import numpy as np
 
 from scipy.optimize import linear_sum_assignment
 
+from server.utils.omrSheet import as_sheet
+
+
+# Local search around each expected bubble: circular window radius, how far a
+# centroid may sit from where the template expects it, the dark fraction a
+# window needs to hold a bubble, recentering passes and how far the last
+# pass may still move a centroid
+LOCAL_WINDOW = 30
+LOCAL_MAX_SHIFT = 12
+LOCAL_MIN_FILL = 0.03
+LOCAL_ITERATIONS = 4
+LOCAL_TOLERANCE = 1.0
+
+
+def local_centers(binary, expected):
+    """
+    Locate bubbles by the dark-pixel centroid in a small window around each
+    expected center, all windows at once.
+
+    Args:
+        binary (np.ndarray): Binarized sheet, white at 255 and ink at 0.
+        expected (np.ndarray): (N,2) expected (x, y) centers.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (N,2) centers and an (N,) mask of
+        bubbles that settled within LOCAL_MAX_SHIFT of their expected center.
+    """
+    padded = np.pad(binary, LOCAL_WINDOW + LOCAL_MAX_SHIFT, constant_values=255)
+    offsets = np.arange(-LOCAL_WINDOW, LOCAL_WINDOW + 1)
+    origin = LOCAL_WINDOW + LOCAL_MAX_SHIFT
+    # Round windows keep neighbouring markers and text out of the corners
+    mask = offsets[:, None] ** 2 + offsets[None, :] ** 2 <= LOCAL_WINDOW**2
+
+    centers = expected.astype(np.float64)
+    moved = np.full(len(expected), np.inf)
+
+    for _ in range(LOCAL_ITERATIONS):
+        # Keep windows inside the padding even for runaway centroids
+        shift = np.clip(np.round(centers - expected), -LOCAL_MAX_SHIFT, LOCAL_MAX_SHIFT)
+        anchor = (np.round(expected) + shift).astype(int) + origin
+
+        rows = anchor[:, 1, None, None] + offsets[None, :, None]
+        cols = anchor[:, 0, None, None] + offsets[None, None, :]
+        windows = (padded[rows, cols] == 0) & mask
+
+        mass = windows.sum(axis=(1, 2))
+        safe_mass = np.where(mass > 0, mass, 1)
+        dx = (windows.sum(axis=1) * offsets).sum(axis=1) / safe_mass
+        dy = (windows.sum(axis=2) * offsets).sum(axis=1) / safe_mass
+
+        previous = centers
+        centers = anchor - origin + np.column_stack((dx, dy))
+        moved = np.abs(centers - previous).max(axis=1)
+
+    # A bubble counts as found once its window holds enough ink, sits near
+    # the template and has stopped moving
+    found = (
+        (mass >= LOCAL_MIN_FILL * mask.sum())
+        & (np.abs(centers - expected).max(axis=1) <= LOCAL_MAX_SHIFT)
+        & (moved <= LOCAL_TOLERANCE)
+    )
 
-def is_circle_inside(circle_center):
-    # from markers 3,5,11,9
-    boundary = [
-        [70.0, 390.5],
-        [2306.0, 390.5],
-        [2306.0, 3294.0],
-        [70.0, 3294.0],
-    ]
-
-    x, y = circle_center
-    x_min, y_min = boundary[0]
-    x_max, y_max = boundary[2]
-
-    if x_min <= x <= x_max and y_min <= y <= y_max:
-        return True
-    else:
-        return False
-
-
-def choice_generator(option, index, total):
-    factor = 4
-    index = index - 1
-    unit = 15
-    x = 55
-    y = 100
-
-    while index < total:
-        if index % 40 == 0 and index != 0:
-            x += 110
-            y = 100
-        elif index % 5 == 0 and index != 0:
-            y += 15
-
-        y += unit
-
-        choices = None
-        if option == 2:
-            choices = [
-                {"value": 1, "chord": [(x) * factor, (y) * factor]},
-                {"value": 0, "chord": [(x + unit) * factor, (y) * factor]},
-            ]
-        elif option == 5:
-            choices = [
-                {"value": 0, "chord": [(x) * factor, (y) * factor]},
-                {"value": 1, "chord": [(x + 1 * unit) * factor, (y) * factor]},
-                {"value": 2, "chord": [(x + 2 * unit) * factor, (y) * factor]},
-                {"value": 3, "chord": [(x + 3 * unit) * factor, (y) * factor]},
-                {"value": 4, "chord": [(x + 4 * unit) * factor, (y) * factor]},
-            ]
-
-        yield {"index": index + 1, "choices": choices}
-
-        index += 1
-
-
-def align_inputs(image, options_count, choice_start, choice_count):
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    image = cv2.GaussianBlur(image, (5, 5), 0)
+    return centers, found
 
-    # cv2.imshow("align_inputs", cv2.resize(image, (0,0), fx=0.2, fy=0.2))
-    # cv2.waitKey(0)
 
+def global_centers(image, layout, expected):
+    """
+    Locate bubbles with HoughCircles over the whole page, matched one to one
+    with the expected centers.
+
+    Returns:
+        np.ndarray: (N,2) center per expected bubble, NaN if unmatched.
+    """
     circles = cv2.HoughCircles(
         image,
         cv2.HOUGH_GRADIENT,
@@ -78,38 +88,53 @@ def align_inputs(image, options_count, choice_start, choice_count):
         maxRadius=50,
     )
 
-    dest_circles = []
+    dest_circles = np.empty((0, 2), dtype=int)
     if circles is not None:
-        circles = np.round(circles[0, :]).astype(int)
+        circles = np.round(circles[0, :, :2]).astype(int)
+        dest_circles = circles[layout.inside(circles)]
 
-        for x, y, r in circles:
-            if is_circle_inside((x, y)):
-                dest_circles.append((x, y))
+    if len(dest_circles) == 0:
+        raise HTTPException(status_code=500, detail="Unable to calculate")
 
-    choices = list(choice_generator(options_count, choice_start, choice_count))
+    distances = np.linalg.norm(expected[:, np.newaxis] - dest_circles, axis=-1)
+    row_indices, col_indices = linear_sum_assignment(distances)
 
-    src_circles = np.array(
-        [choice["chord"] for data in choices for choice in data["choices"]]
-    )
-    dest_circles = np.array(dest_circles)
+    centers = np.full(expected.shape, np.nan)
+    centers[row_indices] = dest_circles[col_indices]
 
-    try:
-        distances = np.linalg.norm(src_circles[:, np.newaxis] - dest_circles, axis=-1)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Unable to calculate")
+    return centers
 
-    row_indices, col_indices = linear_sum_assignment(distances)
 
-    matched_pairs = [(i, j) for i, j in zip(row_indices, col_indices)]
+def align_inputs(image, layout, mode="local"):
+    """
+    Locate the bubbles of a layout on the aligned sheet.
+
+    Args:
+        image (OMRSheet | np.ndarray): The aligned sheet.
+        layout (Layout): The compiled layout from the sheet's QR code.
+        mode (str): "local" searches around each expected bubble first,
+            "global" goes straight to the full-page search.
+
+    Returns:
+        np.ndarray: (questions, options, 2) bubble centers in the layout's
+        shape, NaN where a bubble was not found.
+    """
+    sheet = as_sheet(image)
+
+    # cv2.imshow("align_inputs", cv2.resize(image, (0,0), fx=0.2, fy=0.2))
+    # cv2.waitKey(0)
+
+    expected = layout.centers.reshape(-1, 2)
 
-    for i in range(len(choices)):
-        for j in range(len(choices[i]["choices"])):
-            choices[i]["choices"][j]["chord"] = None
+    centers = None
+    if mode == "local" and len(expected) > 0:
+        local, found = local_centers(sheet.binary, expected)
+        if found.all():
+            centers = np.round(local)
 
-    for pair in matched_pairs:
-        index = pair[0]
-        choices[index // options_count]["choices"][index % options_count]["chord"] = (
-            dest_circles[pair[1]].tolist()
-        )
+    # The template is only a guide; fall back to a full-page search when
+    # any bubble is missing from its window
+    if centers is None:
+        centers = global_centers(sheet.blurred, layout, expected)
 
-    return choices
+    return centers.reshape(layout.centers.shape)
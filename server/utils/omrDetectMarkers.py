@@ -1,12 +1,98 @@
+from functools import lru_cache
+from typing import Optional
+
 from fastapi import HTTPException
 import numpy as np
 
 import cv2
 
+from server.utils.omrSheet import OMRSheet, as_sheet
+
+# Longer side markers are first searched at before refining at full resolution
+COARSE_SIZE = 1280
+# Padding around a coarse hit, as a fraction of the marker size, so the
+# refinement window still holds the marker's quiet zone
+REFINE_MARGIN = 0.5
+
+
+@lru_cache(maxsize=None)
+def get_detector(dictionary: int = cv2.aruco.DICT_4X4_100) -> cv2.aruco.ArucoDetector:
+    """
+    Build an ArUco detector once per dictionary and reuse it across sheets.
+    """
+    return cv2.aruco.ArucoDetector(
+        cv2.aruco.getPredefinedDictionary(dictionary),
+        cv2.aruco.DetectorParameters(),
+    )
+
+
+def refine_marker(gray: np.ndarray, marker_id: int, corners: np.ndarray) -> np.ndarray:
+    """
+    Re-detect one marker at full resolution inside a small window around its
+    coarse corners, keeping the coarse corners if it is not found there.
+    """
+    height, width = gray.shape[:2]
+    size = np.ptp(corners, axis=0).max()
+    x1, y1 = np.floor(corners.min(axis=0) - size * REFINE_MARGIN).astype(int)
+    x2, y2 = np.ceil(corners.max(axis=0) + size * REFINE_MARGIN).astype(int)
+    x1, y1 = max(x1, 0), max(y1, 0)
+    x2, y2 = min(x2, width), min(y2, height)
+
+    roi = cv2.convertScaleAbs(gray[y1:y2, x1:x2], alpha=1.5, beta=0)
+    roi_corners, roi_ids, _ = get_detector().detectMarkers(roi)
+
+    if roi_ids is not None:
+        for roi_id, roi_corner in zip(roi_ids.flatten(), roi_corners):
+            if roi_id == marker_id:
+                return roi_corner + np.array([x1, y1], dtype=np.float32)
+
+    return corners[None]
+
+
+def find_markers(sheet: OMRSheet, coarse_size: Optional[int] = COARSE_SIZE):
+    """
+    Detect ArUco markers on a downscaled copy of the sheet, then refine each
+    hit at full resolution inside a small window around it. Falls back to a
+    full-resolution pass if the coarse one finds nothing.
+
+    Args:
+        sheet (OMRSheet): The sheet to search.
+        coarse_size (Optional[int]): Longer side of the coarse search image,
+            None to search at full resolution.
+
+    Returns:
+        Tuple[List[np.ndarray], Optional[np.ndarray]]: Marker corners of
+        shape (1, 4, 2) and their ids, as `detectMarkers` returns them.
+    """
+    detector = get_detector()
+    gray = sheet.gray
+    scale = coarse_size / max(gray.shape[:2]) if coarse_size else 1
+
+    if scale < 1:
+        small = cv2.resize(
+            gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR
+        )
+        corners, ids, _ = detector.detectMarkers(
+            cv2.convertScaleAbs(small, alpha=1.5, beta=0)
+        )
+
+        if ids is not None:
+            corners = [
+                refine_marker(gray, marker_id, (corner[0] + 0.5) / scale - 0.5)
+                for marker_id, corner in zip(ids.flatten(), corners)
+            ]
+            return corners, ids
+
+    corners, ids, _ = detector.detectMarkers(sheet.contrast)
+    return list(corners), ids
+
+
+def has_corners(ids: Optional[np.ndarray]) -> bool:
+    return ids is not None and sum(num in ids for num in [1, 2, 9, 11]) >= 4
+
 
 def detect_markers(image, findNecessary=True):
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    image = cv2.convertScaleAbs(image, alpha=1.5, beta=0)
+    sheet = as_sheet(image)
     # kernel = np.array([[-1, -1, -1],
     #                    [-1,  9, -1],
     #                    [-1, -1, -1]])
@@ -15,21 +101,18 @@ def detect_markers(image, findNecessary=True):
     # cv2.imshow("detect_markers", cv2.resize(image, (0, 0), fx=0.55, fy=0.55))
     # cv2.waitKey(0)
 
-    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_100)
-    parameters = cv2.aruco.DetectorParameters()
-
-    corners, ids, rejected = cv2.aruco.detectMarkers(
-        image=image, dictionary=aruco_dict, parameters=parameters
-    )
+    corners, ids = find_markers(sheet)
+    if not has_corners(ids):
+        # Markers too small for the coarse pass; search the full image
+        corners, ids = find_markers(sheet, None)
 
     if ids is None:
         raise HTTPException(status_code=404, detail="Unable to Detect any marker")
 
     # print("ids", ids.flatten())
-    sufficient = sum(num in ids for num in [1, 2, 9, 11]) >= 4
     # print("total found", list(num in ids for num in [1, 2, 9, 11]))
 
-    if not sufficient and findNecessary:
+    if not has_corners(ids) and findNecessary:
         raise HTTPException(status_code=404, detail="Unable to Detect Corner markers")
 
     markers = [
@@ -1,44 +1,116 @@
+from functools import lru_cache
 import json
+import threading
+
 import cv2
 from fastapi import HTTPException
 
+from server.utils.omrLayout import get_template, sheet_frame
+from server.utils.omrSheet import as_sheet
 
-def detect_qr(image):
-    x = image.shape[1] - 105 - 380
-    y = 55
-    image = image[y : y + 380, x : x + 380]
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    image = cv2.convertScaleAbs(image, alpha=1.5, beta=0)
+# Extra margin around the QR region, as a fraction of its side, for the
+# last attempts when the code sits off its printed spot
+QR_MARGIN = 0.25
+
+# Parsed metadata kept per distinct payload
+QR_CACHE_SIZE = 256
+
+# Highest question number a QR code may ask for; layouts are compiled as
+# arrays of this many rows at most
+QR_MAX_QUESTIONS = 1000
+
+# QRCodeDetector keeps state between calls, so each thread gets its own
+_local = threading.local()
+
+
+def get_qr_detector() -> cv2.QRCodeDetector:
+    """
+    Build a QR detector once per thread and reuse it across sheets.
+    """
+    detector = getattr(_local, "detector", None)
+    if detector is None:
+        detector = _local.detector = cv2.QRCodeDetector()
+
+    return detector
+
+
+def qr_attempts(sheet):
+    """
+    Yield the QR crops to decode, cheapest and most likely first: the
+    binarized region, then contrast fixes, then a smaller scale and a wider
+    region for codes off their printed spot.
+    """
+    x, y, side = sheet_frame().qr
+    crop = sheet.gray[y : y + side, x : x + side]
 
-    # Upscale the image
-    # image = sr.upsample(image)
-    # image = cv2.resize(image, (0, 0), fx=0.25, fy=0.25)
-    # kernel = np.array([[-1, -1, -1],
-    #                    [-1,  9, -1],
-    #                    [-1, -1, -1]])
-    # image = cv2.filter2D(image, -1, kernel)
+    # The sheet's binary view is already computed for the bubble stages
+    yield sheet.binary[y : y + side, x : x + side]
+    yield cv2.normalize(crop, None, 0, 255, cv2.NORM_MINMAX)
+    yield cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(crop)
+    yield cv2.resize(crop, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
 
-    # cv2.imshow("detect_qr", image)
-    # cv2.waitKey(0)
+    margin = int(side * QR_MARGIN)
+    wide = sheet.gray[
+        max(y - margin, 0) : y + side + margin, max(x - margin, 0) : x + side + margin
+    ]
+    yield wide
+    yield cv2.resize(wide, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
 
-    detector = cv2.QRCodeDetector()
-    retval, info, points, _ = detector.detectAndDecodeMulti(image)
 
-    if retval is False:
-        raise HTTPException(status_code=404, detail="Unable to detected QR Code")
+def is_int(value, low: int, high: int) -> bool:
+    # Exact type check, since JSON booleans load as bool, an int subclass
+    return type(value) is int and low <= value <= high
 
-    # print(info)
 
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def parse_metadata(payload: str) -> dict:
+    """
+    Parse a sheet's QR payload, once per distinct payload. Values are
+    checked here since they key the compiled layout cache.
+
+    Args:
+        payload (str): Decoded QR text.
+
+    Returns:
+        dict: The sheet `scale`, `option` count and `choice` range. Shared
+        between sheets, don't modify.
+    """
     try:
-        data = json.loads(info[0])
+        data = json.loads(payload)
+
+        scale, option = data["scale"], data["option"]
+        start, count, total = data["start"], data["count"], data["total"]
+        if not isinstance(scale, str):
+            raise ValueError(f"Invalid scale {scale!r}")
+        if type(option) is not int or str(option) not in get_template(scale)["options"]:
+            raise ValueError(f"Invalid option {option!r}")
+        if not (
+            is_int(count, 1, QR_MAX_QUESTIONS)
+            and is_int(start, 0, count)
+            and is_int(total, 0, QR_MAX_QUESTIONS)
+        ):
+            raise ValueError(f"Invalid range {start!r}-{count!r} of {total!r}")
+
         return {
-            "scale": data["scale"],
-            "option": data["option"],
-            "choice": {
-                "start": data["start"],
-                "count": data["count"],
-                "total": data["total"],
-            },
+            "scale": scale,
+            "option": option,
+            "choice": {"start": start, "count": count, "total": total},
         }
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid QR Code detected")
+
+
+def detect_qr(image):
+    sheet = as_sheet(image)
+    detector = get_qr_detector()
+
+    for attempt in qr_attempts(sheet):
+        # cv2.imshow("detect_qr", attempt)
+        # cv2.waitKey(0)
+
+        payload, _, _ = detector.detectAndDecode(attempt)
+        if payload:
+            # print(payload)
+            return parse_metadata(payload)
+
+    raise HTTPException(status_code=404, detail="Unable to detected QR Code")
@@ -1,84 +1,103 @@
-import cv2
 import numpy as np
 
-
-def calculate_bw_ratio(image):
-    # Threshold the image to get binary image with white pixels
-    _, binary = cv2.threshold(image, 250, 255, cv2.THRESH_BINARY)
-
-    # Count the white pixels
-    num_white_pixels = np.count_nonzero(binary == 255)
-
-    # Calculate the ratio of white pixels to total pixels
-    height, width = binary.shape
-    num_pixels = width * height
-    white_ratio = num_white_pixels / num_pixels
-
-    return white_ratio
-
-
-def extract_data(image, inputs):
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    _, image = cv2.threshold(image, 64, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+from server.utils.omrSheet import as_sheet
+
+# The fill-ratio gap by which the darkest bubble must beat the runner-up to
+# count as marked
+FILL_THRESHOLD = 0.12
+
+
+def fill_ratios(integral, centers, bubble_size):
+    """
+    Compute the white-pixel ratio of every bubble crop from the sheet's
+    integral image, four lookups per bubble.
+
+    Args:
+        integral (np.ndarray): The sheet's `white_integral`.
+        centers (np.ndarray): (questions, options, 2) bubble centers, NaN
+            where a bubble was not located.
+        bubble_size (int): Side of the square crop around each center.
+
+    Returns:
+        np.ndarray: (questions, options) white ratios, inf for bubbles that
+        were not located or fall outside the sheet.
+    """
+    height, width = integral.shape[0] - 1, integral.shape[1] - 1
+
+    located = ~np.isnan(centers).any(axis=-1)
+    corners = np.trunc(np.where(located[..., None], centers, 0) - bubble_size / 2)
+    corners = corners.astype(int)
+
+    left = np.clip(corners[..., 0], 0, width)
+    right = np.clip(corners[..., 0] + bubble_size, 0, width)
+    top = np.clip(corners[..., 1], 0, height)
+    bottom = np.clip(corners[..., 1] + bubble_size, 0, height)
+
+    white = (
+        integral[bottom, right]
+        - integral[top, right]
+        - integral[bottom, left]
+        + integral[top, left]
+    )
+    area = (right - left) * (bottom - top)
+
+    return np.divide(
+        white,
+        area,
+        out=np.full(area.shape, np.inf),
+        where=located & (area > 0),
+    )
+
+
+def extract_data(image, layout, centers):
+    """
+    Read the marked value of every question.
+
+    Args:
+        image (OMRSheet | np.ndarray): The aligned sheet.
+        layout (Layout): The compiled layout the bubbles were located for.
+        centers (np.ndarray): (questions, options, 2) centers from
+            `align_inputs`.
+
+    Returns:
+        list: `index` and marked `value` per question, None when no bubble
+        stands out.
+    """
+    sheet = as_sheet(image)
 
     # cv2.imshow("align_inputs", cv2.resize(image, (0,0), fx=0.2, fy=0.2))
     # cv2.waitKey(0)
 
-    factor = 4
-    threshold = 0.12
-
-    results = []
-    for input_data in inputs:
-        index = input_data["index"]
-        choices = input_data["choices"]
-
-        bw_ratios = []
-        for choice in choices:
-            chord = choice["chord"]
-            if chord is None:
-                continue
-
-            x, y = chord
-            w, h = 12, 12
-            left = int(x - (w / 2) * factor)
-            top = int(y - (h / 2) * factor)
-            width = int(w * factor)
-            height = int(h * factor)
-
-            crop_image = image[top : top + height, left : left + width]
-
-            # cv2.imwrite(f'./temp/inputs/{index}-{choice["name"]}.jpg', crop_image)
-
-            bw_ratio = calculate_bw_ratio(crop_image)
-            bw_ratios.append(bw_ratio)
-
-        choice_index = bw_ratios.index(min(bw_ratios)) if bw_ratios else None
-        second_choice_index = (
-            bw_ratios.index(
-                min(bw_ratios[:choice_index] + bw_ratios[choice_index + 1 :])
-            )
-            if len(bw_ratios) > 1
-            else None
-        )
+    if len(layout.indices) == 0:
+        return []
 
-        delta_bw_ratio = (
-            bw_ratios[choice_index] - bw_ratios[second_choice_index]
-            if choice_index is not None and second_choice_index is not None
-            else None
-        )
+    ratios = fill_ratios(sheet.white_integral, centers, layout.bubble_size)
+
+    # The darkest bubble and the runner-up, first one on ties
+    order = np.argsort(ratios, axis=1, kind="stable")
+    best = order[:, 0]
+    rows = np.arange(len(ratios))
+    best_ratio = ratios[rows, best]
 
-        if delta_bw_ratio is not None and abs(delta_bw_ratio) >= threshold:
-            choice_index = choice_index if delta_bw_ratio < 0 else second_choice_index
-        else:
-            choice_index = None
+    if ratios.shape[1] > 1:
+        second_ratio = ratios[rows, order[:, 1]]
+    else:
+        second_ratio = np.full(len(ratios), np.inf)
 
-        result = {
+    marked = np.isfinite(second_ratio) & (
+        np.abs(best_ratio - second_ratio) >= FILL_THRESHOLD
+    )
+    values = layout.values[rows, best]
+
+    results = [
+        {
             "index": index,
-            "value": choices[choice_index]["value"]
-            if choice_index is not None
-            else choice_index,
+            "value": value if is_marked else None,
             # 'deltaBWRatio': delta_bw_ratio
         }
-        results.append(result)
+        for index, value, is_marked in zip(
+            layout.indices.tolist(), values.tolist(), marked.tolist()
+        )
+    ]
 
     return results
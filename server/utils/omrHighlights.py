@@ -1,67 +1,134 @@
 import base64
+from typing import Tuple
+
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw
-
 
-def draw_circle(canvas, x, y, circle_type, value=None):
-    draw = ImageDraw.Draw(canvas)
-
-    if circle_type == "alignment":
-        draw.ellipse(
-            (x - 27.5, y - 27.5, x + 27.5, y + 27.5), outline=(34, 197, 94), width=7
+from server.utils.omrSheet import as_sheet
+
+HIGHLIGHT_HEIGHT = 720
+
+# Drawing sizes in sheet pixels, scaled down with the canvas
+ALIGNMENT_RADIUS = 27.5
+ALIGNMENT_THICKNESS = 7
+RESPONSE_RADIUS = 12.5
+RESPONSE_OUTLINE = 3
+
+# BGR
+ALIGNMENT_COLOR = (94, 197, 34)
+RESPONSE_COLORS = [
+    (72, 29, 225),
+    (211, 38, 192),
+    (234, 51, 147),
+    (229, 70, 79),
+    (250, 165, 96),
+]
+OUTLINE_COLOR = (0, 0, 0)
+
+# Fixed-point bits for sub-pixel polygon vertices
+SHIFT = 4
+CIRCLE_POINTS = 24
+
+
+def highlight_base(image) -> Tuple[np.ndarray, float]:
+    """
+    Downscale the binarized sheet to the highlight canvas height.
+
+    Args:
+        image (OMRSheet | np.ndarray): The aligned sheet.
+
+    Returns:
+        Tuple[np.ndarray, float]: Grayscale canvas and the sheet-to-canvas
+        scale.
+    """
+    binary = as_sheet(image).binary
+    height, width = binary.shape[:2]
+
+    scale = HIGHLIGHT_HEIGHT / height
+    new_width = int(scale * width)
+    base = cv2.resize(
+        binary, (new_width, HIGHLIGHT_HEIGHT), interpolation=cv2.INTER_AREA
+    )
+
+    return base, scale
+
+
+def circle_polygons(centers: np.ndarray, radius: float) -> np.ndarray:
+    # Every circle as a fixed-point polygon, built in one broadcast
+    angles = np.linspace(0, 2 * np.pi, CIRCLE_POINTS, endpoint=False)
+    unit = np.column_stack((np.cos(angles), np.sin(angles)))
+    points = centers[:, None, :] + radius * unit[None, :, :]
+
+    return np.round(points * (1 << SHIFT)).astype(np.int32)
+
+
+def render_highlights(base, scale, layout, centers, responses):
+    """
+    Draw the located bubbles and marked responses over a highlight canvas.
+
+    Args:
+        base (np.ndarray): Grayscale canvas from `highlight_base`.
+        scale (float): Sheet-to-canvas scale from `highlight_base`.
+        layout (Layout): The compiled layout of the sheet.
+        centers (np.ndarray): (questions, options, 2) located bubbles, NaN
+            where missing.
+        responses (Optional[list]): Extracted values per question.
+
+    Returns:
+        str: JPEG data URL of the overlay.
+    """
+    canvas = cv2.cvtColor(base, cv2.COLOR_GRAY2BGR)
+
+    located = ~np.isnan(centers).any(axis=-1)
+    dots = centers[located]
+
+    marks = np.zeros(located.shape, dtype=bool)
+    if responses is not None and located.size > 0:
+        chosen = np.array(
+            [
+                -1 if response["value"] is None else response["value"]
+                for response in responses
+            ]
         )
-    else:
-        color_map = [
-            (225, 29, 72),
-            (192, 38, 211),
-            (147, 51, 234),
-            (79, 70, 229),
-            (96, 165, 250),
-        ]
-        color = color_map[value] if value is not None else color_map[0]
-        draw.ellipse(
-            (x - 12.5, y - 12.5, x + 12.5, y + 12.5),
-            fill=color,
-            outline=(0, 0, 0),
-            width=3,
+        marks = located & (layout.values == chosen[:, None])
+
+    if len(dots):
+        rings = circle_polygons(dots * scale, ALIGNMENT_RADIUS * scale)
+        cv2.polylines(
+            canvas,
+            list(rings),
+            True,
+            ALIGNMENT_COLOR,
+            max(1, round(ALIGNMENT_THICKNESS * scale)),
+            cv2.LINE_AA,
+            SHIFT,
         )
 
-
-def get_highlights(image, option_count, inputs, responses):
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    _, image = cv2.threshold(image, 64, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
-
-    is_alignment = True
-    is_response = True if responses is not None else False
-
-    inputs = [[choice["chord"] for choice in input["choices"]] for input in inputs]
-    canvas = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-    for q_index, input in enumerate(inputs):
-        for d_index, dot in enumerate(input):
-            if dot is None:
-                continue
-
-            x, y = dot
-
-            if is_alignment:
-                draw_circle(canvas, x, y, "alignment")
-
-            if is_response:
-                choice = responses[q_index]["value"] if responses is not None else None
-                if choice is not None:
-                    if option_count == 2 and choice == 1 - d_index:
-                        draw_circle(canvas, x, y, "response", choice * 4)
-                    elif option_count == 5 and choice == d_index:
-                        draw_circle(canvas, x, y, "response", choice)
-
-    canvas = cv2.cvtColor(np.array(canvas), cv2.COLOR_RGB2BGR)
-
-    height, width = canvas.shape[:2]
-    new_width = int((720 / height) * width)
-    canvas = cv2.resize(canvas, (new_width, 720))
+    if marks.any():
+        # Spread the option values over the palette, so both ends of a
+        # two-option sheet get the outer colors
+        top = max(int(layout.values.max()), 1)
+        values = layout.values[marks] * (len(RESPONSE_COLORS) - 1) // top
+        fills = circle_polygons(centers[marks] * scale, RESPONSE_RADIUS * scale)
+
+        # One fill call per color, then all outlines together
+        for value in np.unique(values):
+            cv2.fillPoly(
+                canvas,
+                list(fills[values == value]),
+                RESPONSE_COLORS[value],
+                cv2.LINE_AA,
+                SHIFT,
+            )
+        cv2.polylines(
+            canvas,
+            list(fills),
+            True,
+            OUTLINE_COLOR,
+            max(1, round(RESPONSE_OUTLINE * scale)),
+            cv2.LINE_AA,
+            SHIFT,
+        )
 
     # cv2.imshow("highlighted", canvas)
     # cv2.waitKey(0)
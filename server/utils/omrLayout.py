@@ -0,0 +1,150 @@
+from functools import lru_cache
+import glob
+import json
+import os
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+import numpy as np
+
+from server.core.config import config
+
+BUILTIN_LAYOUTS_PATH = os.path.join(os.path.dirname(__file__), "..", "layouts")
+DEFAULT_SCALE = "default"
+
+
+def load_templates(*paths: str) -> Dict[str, dict]:
+    """
+    Read every layout template JSON under the given directories, keyed by
+    each QR `scale` it lists. Later directories override earlier ones and
+    fields a template leaves out come from the default template.
+
+    Args:
+        *paths (str): Directories of templates; missing ones are skipped.
+
+    Returns:
+        Dict[str, dict]: Template per scale.
+    """
+    templates = {}
+
+    for path in paths:
+        for file_path in sorted(glob.glob(os.path.join(path, "*.json"))):
+            with open(file_path) as file:
+                template = json.load(file)
+            for scale in template.get("scales", []):
+                templates[scale] = template
+
+    default = templates[DEFAULT_SCALE]
+    return {scale: {**default, **template} for scale, template in templates.items()}
+
+
+templates = load_templates(BUILTIN_LAYOUTS_PATH, config.omr_layouts_path)
+
+
+def get_template(scale: Optional[str] = None) -> dict:
+    return templates.get(scale, templates[DEFAULT_SCALE])
+
+
+class SheetFrame:
+    """
+    Where the aligned sheet and its fixed features sit. Alignment and the
+    QR read happen before the sheet design is known, so every design
+    shares the default template's frame.
+
+    Attributes:
+        size (Tuple[int, int]): Aligned sheet (width, height).
+        markers (Dict[int, List[float]]): ArUco id to its center.
+        qr (Tuple[int, int, int]): QR code region (left, top, side).
+    """
+
+    def __init__(self, template: dict):
+        self.size = tuple(template["size"])
+        self.markers = {
+            int(id): position for id, position in template["markers"].items()
+        }
+        self.qr = tuple(template["qr"])
+
+
+class Layout:
+    """
+    A sheet design compiled for one question range, as arrays the OMR
+    stages index directly.
+
+    Attributes:
+        boundary (np.ndarray): (2,2) top-left and bottom-right corners of the
+            area bubbles sit in.
+        bubble_size (int): Side of the square scored around each bubble.
+        indices (np.ndarray): (questions,) question numbers.
+        centers (np.ndarray): (questions, options, 2) expected bubble (x, y).
+        values (np.ndarray): (questions, options) value of each bubble.
+    """
+
+    def __init__(self, template: dict, option_count: int, start: int, count: int):
+        values = template["options"].get(str(option_count))
+        if values is None:
+            raise HTTPException(
+                status_code=400, detail=f"Unsupported option count {option_count}"
+            )
+
+        bubbles = template["bubbles"]
+        factor = bubbles["factor"]
+
+        self.boundary = np.array(template["boundary"], dtype=np.float64)
+        self.bubble_size = bubbles["bubble_size"] * factor
+
+        # Questions `start` to `count`, both inclusive, filled down columns
+        # of `column_size` rows with a gap after every `group_size` rows
+        questions = np.arange(max(start, 1) - 1, count)
+        row = questions % bubbles["column_size"]
+        column = questions // bubbles["column_size"]
+
+        x = bubbles["origin"][0] + column * bubbles["column_step"]
+        y = (
+            bubbles["origin"][1]
+            + (row + 1) * bubbles["row_step"]
+            + (row // bubbles["group_size"]) * bubbles["group_gap"]
+        )
+        x = x[:, None] + np.arange(len(values)) * bubbles["option_step"]
+        y = np.broadcast_to(y[:, None], x.shape)
+
+        self.indices = questions + 1
+        self.centers = np.stack((x, y), axis=-1).astype(np.float64) * factor
+        self.values = np.broadcast_to(np.array(values), x.shape)
+
+    def inside(self, points: np.ndarray) -> np.ndarray:
+        """
+        Mask of the (N,2) points that fall within the bubble boundary.
+        """
+        return np.all(
+            (points >= self.boundary[0]) & (points <= self.boundary[1]), axis=-1
+        )
+
+
+@lru_cache(maxsize=1)
+def sheet_frame() -> SheetFrame:
+    return SheetFrame(get_template())
+
+
+@lru_cache(maxsize=config.omr_layout_cache_size)
+def compile_layout(
+    scale: Optional[str], option_count: int, start: int, count: int
+) -> Layout:
+    """
+    Compile the layout for a QR code's metadata, once per distinct key.
+
+    Args:
+        scale (Optional[str]): The QR `scale`; unknown ones use the default
+            template.
+        option_count (int): Options per question.
+        start (int): First question number.
+        count (int): Last question number.
+
+    Returns:
+        Layout: The compiled layout. Its arrays are shared between sheets
+        and read-only.
+    """
+    layout = Layout(get_template(scale), option_count, start, count)
+    for array in (layout.boundary, layout.indices, layout.centers):
+        array.flags.writeable = False
+
+    return layout
@@ -0,0 +1,83 @@
+import numpy as np
+
+from server.utils.omrAlignCrop import align_crop
+from server.utils.omrAlignInput import align_inputs
+from server.utils.omrDetectMarkers import detect_markers
+from server.utils.omrDetectQR import detect_qr
+from server.utils.omrExtractData import extract_data
+from server.utils.omrHighlights import highlight_base, render_highlights
+from server.utils.omrLayout import compile_layout
+from server.utils.omrSheet import OMRSheet
+
+
+def omr_pipeline(image: np.ndarray, highlights: str = "inline") -> dict:
+    """
+    Read an OMR sheet end to end: markers, alignment, QR metadata, bubbles
+    and the highlighted overlay. Module level so it can run in a worker
+    process.
+
+    Args:
+        image (np.ndarray): Decoded sheet image.
+        highlights (str): "inline" renders the overlay, "deferred" returns
+            what is needed to render it later as `overlay`, "none" skips it.
+
+    Returns:
+        dict: The `data` (name and choices) and `highlights` of the sheet,
+        plus `overlay` when deferred.
+    """
+    # Each stage reads the gray/binary views it needs from the sheet, so
+    # they are computed once per image
+    sheet = OMRSheet(image)
+    markers = detect_markers(sheet)
+    # print("markers", markers)
+    cropped_image = align_crop(sheet, markers)
+    # print("cropped_image", cropped_image)
+    meta_data = detect_qr(cropped_image)
+    # print("meta_data", meta_data)
+
+    # Compiled once per sheet design and question range, then shared
+    layout = compile_layout(
+        meta_data["scale"],
+        meta_data["option"],
+        meta_data["choice"]["start"],
+        meta_data["choice"]["count"],
+    )
+
+    centers = align_inputs(cropped_image, layout)
+    choices = extract_data(cropped_image, layout, centers)
+
+    result = {
+        "data": {"name": meta_data["scale"], "choices": choices},
+        "highlights": None,
+    }
+
+    if highlights != "none":
+        # Only the 720p canvas is kept, never the full-size sheet
+        base, scale = highlight_base(cropped_image)
+        overlay = {
+            "base": base,
+            "scale": scale,
+            "layout": layout,
+            "centers": centers,
+            "choices": choices,
+        }
+
+        if highlights == "deferred":
+            result["overlay"] = overlay
+        else:
+            result["highlights"] = render_overlay(overlay)
+
+    return result
+
+
+def render_overlay(overlay: dict) -> str:
+    """
+    Render the highlights kept by a deferred `omr_pipeline` call.
+    """
+    return render_highlights(
+        overlay["base"],
+        overlay["scale"],
+        overlay["layout"],
+        overlay["centers"],
+        overlay["choices"],
+    )
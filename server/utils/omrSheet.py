@@ -0,0 +1,54 @@
+from functools import cached_property
+
+import cv2
+import numpy as np
+
+
+class OMRSheet:
+    """
+    One sheet image and the views the OMR stages read from it. Each view
+    is computed on first use and kept for the rest of the request.
+
+    Args:
+        image (np.ndarray): BGR or already grayscale sheet image.
+    """
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+
+    @property
+    def shape(self):
+        return self.image.shape[:2]
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        if self.image.ndim == 2:
+            return self.image
+        return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def contrast(self) -> np.ndarray:
+        return cv2.convertScaleAbs(self.gray, alpha=1.5, beta=0)
+
+    @cached_property
+    def blurred(self) -> np.ndarray:
+        return cv2.GaussianBlur(self.gray, (5, 5), 0)
+
+    @cached_property
+    def binary(self) -> np.ndarray:
+        # Otsu picks the level; white paper at 255, ink at 0
+        _, binary = cv2.threshold(
+            self.gray, 64, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
+        )
+        return binary
+
+    @cached_property
+    def white_integral(self) -> np.ndarray:
+        return cv2.integral((self.binary == 255).view(np.uint8))
+
+
+def as_sheet(image) -> OMRSheet:
+    """
+    Wrap a plain image in an OMRSheet, passing existing sheets through.
+    """
+    return image if isinstance(image, OMRSheet) else OMRSheet(image)
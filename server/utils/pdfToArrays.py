@@ -0,0 +1,69 @@
+import threading
+from typing import Iterator
+
+from fastapi import HTTPException
+import numpy as np
+
+# PDFium is not thread-safe, so every call into it holds this lock
+_lock = threading.Lock()
+
+
+def is_pdf(data: bytes) -> bool:
+    return data[:5] == b"%PDF-"
+
+
+def open_pdf(pdf_bytes: bytes):
+    try:
+        import pypdfium2
+    except ImportError:
+        raise HTTPException(
+            status_code=501, detail="PDF uploads require the `pypdfium2` package"
+        )
+
+    try:
+        with _lock:
+            return pypdfium2.PdfDocument(pdf_bytes)
+    except pypdfium2.PdfiumError:
+        raise HTTPException(status_code=400, detail="Invalid PDF uploaded")
+
+
+def pdf_page_count(pdf_bytes: bytes) -> int:
+    document = open_pdf(pdf_bytes)
+    with _lock:
+        count = len(document)
+        document.close()
+
+    return count
+
+
+def pdf_to_arrays(pdf_bytes: bytes, dpi: int) -> Iterator[np.ndarray]:
+    """
+    Render the pages of a PDF one at a time as grayscale arrays.
+
+    A page is only rendered when the iterator is advanced, so callers can
+    step it from a worker thread while holding few pages in memory.
+
+    Args:
+        pdf_bytes (bytes): The PDF file.
+        dpi (int): Render resolution.
+
+    Returns:
+        Iterator[np.ndarray]: (height, width) uint8 image per page.
+    """
+    document = open_pdf(pdf_bytes)
+    try:
+        with _lock:
+            count = len(document)
+
+        for index in range(count):
+            with _lock:
+                page = document[index]
+                bitmap = page.render(scale=dpi / 72, grayscale=True)
+                image = bitmap.to_numpy().copy()
+                bitmap.close()
+                page.close()
+
+            yield image
+    finally:
+        with _lock:
+            document.close()
@@ -0,0 +1,237 @@
+from abc import ABC, abstractmethod
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from server.core.config import config
+from server.utils.imageCache import ImageCache
+
+
+def result_key(kind: str, image_bytes: bytes, params: Optional[dict] = None) -> str:
+    """
+    Build a cache key from the uploaded image bytes and request parameters.
+
+    Args:
+        kind (str): Result type, e.g. "detect" or "omr".
+        image_bytes (bytes): Encoded image file as uploaded.
+        params (Optional[dict]): Request parameters that change the result.
+
+    Returns:
+        str: Hex digest identifying this submission.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(kind.encode())
+    digest.update(json.dumps(params or {}, sort_keys=True).encode())
+    digest.update(image_bytes)
+
+    return digest.hexdigest()
+
+
+class ResultCache(ABC):
+    """
+    Result cache backend interface. Results are JSON-serializable dicts.
+
+    Backends implement `load` and `store` as coroutines, so the ones doing
+    I/O can move it off the event loop.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        result = await self.load(key)
+
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return result
+
+    async def put(self, key: str, result: dict) -> None:
+        await self.store(key, json.dumps(result))
+
+    @abstractmethod
+    async def load(self, key: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def store(self, key: str, content: str) -> None: ...
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class NullResultCache(ResultCache):
+    async def load(self, key: str) -> Optional[dict]:
+        return None
+
+    async def store(self, key: str, content: str) -> None:
+        pass
+
+
+class MemoryResultCache(ResultCache):
+    """
+    In-process LRU, bounded by the size of the serialized results.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        super().__init__()
+        self.cache = ImageCache(max_bytes, ttl)
+
+    async def load(self, key: str) -> Optional[dict]:
+        content = self.cache.get(key)
+
+        return json.loads(content) if content is not None else None
+
+    async def store(self, key: str, content: str) -> None:
+        self.cache.put(key, content, len(content))
+
+    def stats(self) -> dict:
+        return {**super().stats(), **self.cache.stats()}
+
+
+class DiskResultCache(ResultCache):
+    """
+    On-disk store of one JSON file per key, sharded by key prefix, shared by
+    every worker pointing at the same path.
+
+    Each file records its expiry and is dropped when read past it. Once the
+    files written grow past `max_bytes`, a prune removes expired files and
+    then the least recently written ones until the directory fits again.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        # Estimate of the directory size; workers sharing the path each keep
+        # their own, and every prune resets it from the files on disk
+        self.size: Optional[int] = None
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def file_path(self, key: str) -> str:
+        return f"{self.path}/{key[:2]}/{key}.json"
+
+    async def load(self, key: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.read, key)
+
+    async def store(self, key: str, content: str) -> None:
+        await asyncio.to_thread(self.write, key, content)
+
+    def read(self, key: str) -> Optional[dict]:
+        file_path = self.file_path(key)
+        try:
+            with open(file_path) as file:
+                entry = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            entry = None
+
+        try:
+            if entry["expires"] >= time.time():
+                return entry["result"]
+        except (KeyError, TypeError):
+            # Truncated, foreign or pre-expiry files are dropped like expired
+            pass
+
+        self.remove(file_path)
+        return None
+
+    def write(self, key: str, content: str) -> None:
+        file_path = self.file_path(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        # The result is already serialized, so wrap it without parsing it
+        content = f'{{"expires": {time.time() + self.ttl}, "result": {content}}}'
+
+        # Write then rename so readers never see a partial file
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(content)
+        os.replace(temp_path, file_path)
+
+        with self.lock:
+            if self.size is None:
+                self.size = self.prune()
+            else:
+                self.size += len(content)
+                if self.size > self.max_bytes:
+                    self.size = self.prune()
+
+    def prune(self) -> int:
+        """
+        Remove expired files, then the oldest ones past `max_bytes`.
+
+        Returns:
+            int: Bytes left in the cache directory.
+        """
+        now = time.time()
+        files = []
+        for file_path in glob.glob(f"{self.path}/*/*.json"):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file_path))
+
+        size = 0
+        kept = []
+        for mtime, file_size, file_path in files:
+            if mtime + self.ttl < now:
+                self.remove(file_path)
+            else:
+                size += file_size
+                kept.append((mtime, file_size, file_path))
+
+        for _, file_size, file_path in sorted(kept):
+            if size <= self.max_bytes:
+                break
+            self.remove(file_path)
+            size -= file_size
+
+        return size
+
+    def remove(self, file_path: str) -> None:
+        try:
+            os.remove(file_path)
+            self.evictions += 1
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+def create_result_cache(backend: str) -> ResultCache:
+    if backend == "memory":
+        return MemoryResultCache(config.result_cache_max_bytes, config.result_cache_ttl)
+    if backend == "disk":
+        return DiskResultCache(
+            config.result_cache_path,
+            config.result_cache_max_bytes,
+            config.result_cache_ttl,
+        )
+
+    return NullResultCache()
+
+
+result_cache = create_result_cache(config.result_cache_backend)
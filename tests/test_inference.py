@@ -0,0 +1,130 @@
+import asyncio
+import base64
+import json
+
+import httpx
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+import onnxruntime
+import pytest
+
+from server.core import serving
+from server.core.config import config
+from server.core.inference import OnnxBackend, TFServingBackend
+
+FEATURES = 4
+CLASSES = 3
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory) -> str:
+    """
+    A tiny stand-in model: softmax(relu(x @ W + b)) over a dynamic batch.
+    """
+    rng = np.random.default_rng(0)
+    weights = rng.normal(size=(FEATURES, CLASSES)).astype(np.float32)
+    bias = rng.normal(size=(CLASSES,)).astype(np.float32)
+
+    graph = helper.make_graph(
+        [
+            helper.make_node("MatMul", ["inputs", "weights"], ["product"]),
+            helper.make_node("Add", ["product", "bias"], ["logits"]),
+            helper.make_node("Relu", ["logits"], ["activations"]),
+            helper.make_node("Softmax", ["activations"], ["outputs"], axis=-1),
+        ],
+        "stand-in",
+        [helper.make_tensor_value_info("inputs", TensorProto.FLOAT, ["N", FEATURES])],
+        [helper.make_tensor_value_info("outputs", TensorProto.FLOAT, ["N", CLASSES])],
+        initializer=[
+            numpy_helper.from_array(weights, "weights"),
+            numpy_helper.from_array(bias, "bias"),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+
+    path = tmp_path_factory.mktemp("models") / "stand-in.onnx"
+    onnx.save(model, str(path))
+
+    return str(path)
+
+
+@pytest.fixture
+def tf_serving(model_path, monkeypatch):
+    """
+    Stand in for TF Serving's REST predict endpoint, serving the same model.
+    """
+    session = onnxruntime.InferenceSession(
+        model_path, providers=["CPUExecutionProvider"]
+    )
+    requests = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        instances = json.loads(request.content)["instances"]
+
+        if isinstance(instances[0], dict):
+            batch = np.stack(
+                [
+                    np.frombuffer(base64.b64decode(instance["b64"]), np.float32)
+                    for instance in instances
+                ]
+            ).reshape(len(instances), FEATURES)
+        else:
+            batch = np.asarray(instances, dtype=np.float32)
+
+        (predictions,) = session.run(None, {"inputs": batch})
+        return httpx.Response(200, json={"predictions": predictions.tolist()})
+
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handle), base_url="http://tf-serving"
+    )
+    monkeypatch.setattr(serving, "client", client)
+
+    yield requests
+
+    asyncio.run(client.aclose())
+
+
+@pytest.mark.parametrize("transport", ["json", "b64"])
+@pytest.mark.parametrize("dtype", [np.float32, np.uint8])
+def test_onnx_matches_tf_serving(model_path, tf_serving, monkeypatch, transport, dtype):
+    monkeypatch.setattr(config, "tensorflow_transport", transport)
+
+    rng = np.random.default_rng(1)
+    instances = (rng.random((5, FEATURES)) * 255).astype(dtype)
+
+    onnx_backend = OnnxBackend("stand-in", model_path)
+    tf_backend = TFServingBackend("stand-in", 5.0, "inputs", "float32")
+
+    async def predict():
+        await onnx_backend.load()
+        return await asyncio.gather(
+            onnx_backend.predict(instances), tf_backend.predict(instances)
+        )
+
+    onnx_output, tf_output = asyncio.run(predict())
+
+    assert len(tf_serving) == 1
+    assert tf_serving[0].url.path == "/v1/models/stand-in:predict"
+    assert onnx_output.shape == tf_output.shape == (len(instances), CLASSES)
+    np.testing.assert_allclose(onnx_output, tf_output, rtol=1e-6, atol=1e-6)
+
+
+def test_onnx_backend_batches_independently(model_path):
+    rng = np.random.default_rng(2)
+    instances = rng.normal(size=(6, FEATURES)).astype(np.float32)
+
+    backend = OnnxBackend("stand-in", model_path)
+
+    async def predict():
+        whole = await backend.predict(instances)
+        parts = await asyncio.gather(
+            backend.predict(instances[:2]), backend.predict(instances[2:])
+        )
+        return whole, np.concatenate(parts)
+
+    whole, parts = asyncio.run(predict())
+
+    np.testing.assert_allclose(whole, parts, rtol=1e-6, atol=1e-6)